@@ -0,0 +1,285 @@
+"""
+assistant_server.py
+-------------------
+複数のデスク端末から使う “サーバーモード”。
+gemini.py の 1 ターン（transcribe → 振り分け → get_gpt_reply → synthesize_voice）を
+WebSocket で公開する。Whisper モデルはプロセスで 1 つだけ持ち、
+同時に来た文字起こしは WhisperBatcher でまとめて推論する。
+
+    python assistant_server.py --port 8765 --max-batch-wait 0.05
+
+📡 プロトコル（1 接続 = 1 セッション）
+    → {"type": "hello", "session": "desk-01", "system_prompt": "...(省略可)", "token": "..."}
+    ← {"type": "ready", "session": "desk-01", "history": 12}
+    → バイナリ（WAV）                        … 音声で 1 ターン
+    → {"type": "text", "text": "..."}        … 文字で 1 ターン（ASR を飛ばす）
+    ← {"type": "reply", "user": "...", "route": "chat", "text": "...", "degraded": false,
+       "timing": {...}}                      … degraded は Gemini が落ちて定型文を返したとき true
+    ← バイナリ（合成 WAV）  ／ 合成できなければ {"type": "audio_unavailable"}
+    → {"type": "stats"}
+    ← {"type": "stats", "whisper": {...}, "sessions": 3}
+
+セッションごとの履歴・記憶（persona）・会話ログは sessions/<id>/ に置く。
+最後の接続が切れたセッションはメモリから外し、会話ログのスレッドとコネクションを閉じる
+（再接続したら sessions/<id>/ から読み直す）。
+
+🔐 セッション ID を知っていれば誰でもその端末の履歴に入れる
+（「前に〜話した？」で過去のやり取りも引ける）。localhost 以外で待ち受けるときは
+--token（または ASSISTANT_SERVER_TOKEN）で共有シークレットを必須にする。
+"""
+
+import argparse
+import asyncio
+import hmac
+import io
+import json
+import os
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from functools import partial
+from pathlib import Path
+
+import websockets
+
+import gemini as gemini_core
+from conversation_store import ConversationStore
+from whisper_batcher import WhisperBatcher
+
+SESSION_ID_PATTERN = re.compile(r"[\w\-]{1,64}")
+MAX_AUDIO_BYTES = 10 * 1024 * 1024     # 1 発話の上限（8 秒の WAV なら十分）
+LOOPBACK_HOSTS = {"127.0.0.1", "localhost", "::1"}
+
+
+@dataclass
+class Session:
+    """1 端末分の状態"""
+    id: str
+    dir: Path
+    system_prompt: str
+    store: ConversationStore
+    history: deque = field(default_factory=lambda: deque(maxlen=30))
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)   # 同じセッションのターンは直列
+    connections: int = 0                                        # 0 になったら登録から外す
+
+    @property
+    def memory_file(self) -> Path:
+        return self.dir / "gpt_memory.json"
+
+
+class SessionRegistry:
+    """
+    セッション ID → Session（接続中のものだけ持つ）
+    再接続しても履歴は sessions/<id>/ の会話ログから戻るので引き継がれる
+    """
+
+    def __init__(self, root: Path):
+        self.root = root
+        self._sessions: dict[str, Session] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def acquire(self, session_id: str, system_prompt: str | None = None) -> Session:
+        """接続 1 本分の参照を取って Session を返す（終わったら release）"""
+        with self._lock:
+            session = self._get(session_id, system_prompt)
+            session.connections += 1
+            return session
+
+    def release(self, session: Session) -> None:
+        """最後の接続が切れたら登録から外し、会話ログを閉じる"""
+        with self._lock:
+            session.connections -= 1
+            if session.connections > 0:
+                return
+            if self._sessions.get(session.id) is session:
+                del self._sessions[session.id]
+        session.store.close()           # 書き込み待ちの分はここで書き切る
+
+    def _get(self, session_id: str, system_prompt: str | None) -> Session:
+        session = self._sessions.get(session_id)
+        if session is None:
+            session_dir = self.root / session_id
+            session_dir.mkdir(parents=True, exist_ok=True)
+            store = ConversationStore(
+                session_dir / "conversation_log.db",
+                retention_days=gemini_core.CONVERSATION_RETENTION_DAYS,
+                max_turns=gemini_core.CONVERSATION_MAX_TURNS,
+            )
+            session = Session(session_id, session_dir,
+                              system_prompt or gemini_core.SYSTEM_PROMPT, store)
+            for t in store.recent(session.history.maxlen // 2):
+                session.history.append({"role": "user",      "content": t.user})
+                session.history.append({"role": "assistant", "content": t.assistant})
+            self._sessions[session_id] = session
+        elif system_prompt:
+            session.system_prompt = system_prompt
+        return session
+
+
+class AssistantServer:
+    """
+    🖥️ 複数セッション対応のアシスタントサーバー
+    ------------------------------------------
+    I/O 待ちの多い Gemini / AIVISpeech 呼び出しはスレッドプールで回し、
+    イベントループは WebSocket の送受信だけを受け持つ。
+    """
+
+    def __init__(self, batcher: WhisperBatcher, sessions_dir: Path, workers: int = 16,
+                 token: str | None = None):
+        self.batcher = batcher
+        self.token = token
+        self.registry = SessionRegistry(sessions_dir)
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="turn")
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.pool, partial(fn, *args))
+
+    async def handle(self, ws):
+        try:
+            hello = json.loads(await ws.recv())
+        except (json.JSONDecodeError, TypeError):
+            await ws.close(code=1003, reason="hello が必要です")
+            return
+        if not isinstance(hello, dict):
+            hello = {}
+        session_id = str(hello.get("session", ""))
+        if hello.get("type") != "hello" or not SESSION_ID_PATTERN.fullmatch(session_id):
+            await ws.close(code=1003, reason="不正なセッション ID")
+            return
+        if self.token and not hmac.compare_digest(str(hello.get("token", "")), self.token):
+            await ws.close(code=1008, reason="トークンが違います")
+            return
+
+        session = await self._run(self.registry.acquire, session_id, hello.get("system_prompt"))
+        try:
+            print(f"🔌 接続: {session_id}（履歴 {len(session.history)} 件）")
+            await ws.send(json.dumps({"type": "ready", "session": session_id,
+                                      "history": len(session.history)}))
+            await self._serve_session(ws, session)
+        finally:
+            await self._run(self.registry.release, session)
+            print(f"🔌 切断: {session_id}")
+
+    async def _serve_session(self, ws, session: Session):
+        async for msg in ws:
+            if isinstance(msg, bytes):
+                await self.turn(ws, session, audio=msg)
+                continue
+            try:
+                req = json.loads(msg)
+            except json.JSONDecodeError:
+                await ws.send(json.dumps({"type": "error", "error": "JSON ではありません"}))
+                continue
+            if req.get("type") == "text":
+                await self.turn(ws, session, text=str(req.get("text", "")))
+            elif req.get("type") == "stats":
+                await ws.send(json.dumps({
+                    "type": "stats",
+                    "whisper": self.batcher.stats.as_dict(),
+                    "sessions": len(self.registry),
+                }, ensure_ascii=False))
+            else:
+                await ws.send(json.dumps({"type": "error", "error": "未知のメッセージ"}))
+
+    async def turn(self, ws, session: Session, audio: bytes | None = None, text: str | None = None):
+        """1 ターン分（文字起こし → 振り分け → 応答 → 合成）"""
+        async with session.lock:
+            timing = {}
+            t0 = time.perf_counter()
+            if audio is not None:
+                if len(audio) > MAX_AUDIO_BYTES:
+                    await ws.send(json.dumps({"type": "error", "error": "音声が大きすぎます"}))
+                    return
+                try:
+                    fut = await self._run(self.batcher.submit, io.BytesIO(audio))
+                    text = await asyncio.wrap_future(fut)
+                except Exception as e:
+                    await ws.send(json.dumps({"type": "error", "error": f"文字起こし失敗: {e}"},
+                                             ensure_ascii=False))
+                    return
+                timing["asr"] = time.perf_counter() - t0
+            print(f"👤 [{session.id}] {text}")
+
+            t1 = time.perf_counter()
+            route, reply = await self._run(
+                gemini_core.route_reply, text, session.history, session.memory_file,
+                session.store, session.system_prompt,
+            )
+            timing["reply"] = time.perf_counter() - t1
+
+            t2 = time.perf_counter()
+            voice_path = await self._run(gemini_core.synthesize_voice, reply)
+            wav = await self._run(_read_and_remove, voice_path) if voice_path else None
+            timing["tts"] = time.perf_counter() - t2
+            timing["total"] = time.perf_counter() - t0
+
+            degraded = reply in gemini_core.CANNED_PHRASES.values()
+            await ws.send(json.dumps({"type": "reply", "user": text, "route": route,
+                                      "text": reply, "degraded": degraded, "timing": timing},
+                                     ensure_ascii=False))
+            if wav:
+                await ws.send(wav)
+            else:
+                await ws.send(json.dumps({"type": "audio_unavailable"}))
+
+
+def _read_and_remove(path: str) -> bytes | None:
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+async def serve(args):
+    # ターン用スレッドが同時に Gemini / AIVISpeech を呼んでも待たされないように揃える
+    for backend in (gemini_core.gemini_backend, gemini_core.aivis_backend):
+        backend.set_max_workers(args.workers)
+    # 縮退時の定型音声だけは使うので温める（会話ログ・Flask などの手元用サービスは起動しない）
+    threading.Thread(target=gemini_core.warm_canned_voices, daemon=True).start()
+    batcher = WhisperBatcher(
+        gemini_core.whisper_model,
+        max_batch_size=args.max_batch_size,
+        max_batch_wait=args.max_batch_wait,
+        language=args.language,
+    )
+    server = AssistantServer(batcher, Path(args.sessions_dir), workers=args.workers,
+                             token=args.token)
+    async with websockets.serve(server.handle, args.host, args.port, max_size=MAX_AUDIO_BYTES):
+        print(f"🖥️ サーバーモード起動: ws://{args.host}:{args.port}"
+              f"（バッチ最大 {args.max_batch_size} 件 / 待ち {args.max_batch_wait * 1e3:.0f}ms）")
+        await asyncio.Future()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Desktop AI Assistant サーバーモード")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--max-batch-size", type=int, default=8)
+    parser.add_argument("--max-batch-wait", type=float, default=0.05,
+                        help="最初の文字起こし要求から後続を待つ最大秒")
+    parser.add_argument("--language", default=os.getenv("WHISPER_LANGUAGE", "ja"))
+    parser.add_argument("--sessions-dir", default="sessions")
+    parser.add_argument("--workers", type=int, default=16, help="Gemini / TTS 用スレッド数")
+    parser.add_argument("--token", default=os.getenv("ASSISTANT_SERVER_TOKEN"),
+                        help="hello に必須の共有シークレット（localhost 以外で待ち受けるときは必須）")
+    args = parser.parse_args()
+    if args.host not in LOOPBACK_HOSTS and not args.token:
+        parser.error("localhost 以外で待ち受けるときは --token を指定してください")
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        print("👋 サーバー終了")
+
+
+if __name__ == "__main__":
+    main()
@@ -30,6 +30,10 @@ class AssistantBackend:
         # 同時に 1 つだけタスクを走らせる
         self.executor = ThreadPoolExecutor(max_workers=1)
         self._lock = threading.Lock()
+        # 会話ログ・ブラウザ受信など手元用のサービスを起動
+        gemini_core.start_local_services()
+        # 2 段認識の小モデルを温めておく（録音用の executor に積むと最初の F2 が待たされる）
+        threading.Thread(target=gemini_core.get_tiered_recognizer, daemon=True).start()
 
     # ----------------------------
     # メインハンドラ
@@ -62,10 +66,14 @@ class AssistantBackend:
                 voice_path = gemini_core.process_audio_and_generate_reply(wav_path)
 
                 # 3) 合成音声を再生 --------------------------------------
+                #    音声合成が縮退したときは返事を文字で出す
+                if gemini_core.last_voice_degraded:
+                    on_status_print(f"💬 {gemini_core.last_spoken_text}")
                 if voice_path:
-                    on_status_print("🔊 応答を再生中 ...")
+                    if not gemini_core.last_voice_degraded:
+                        on_status_print("🔊 応答を再生中 ...")
                     gemini_core.play_voice(voice_path)
-                else:
+                elif not gemini_core.last_voice_degraded:
                     on_status_print("⚠️ 合成音声が生成できなかったよ")
 
             except Exception as e:
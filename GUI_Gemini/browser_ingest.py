@@ -0,0 +1,271 @@
+"""
+browser_ingest.py
+-----------------
+Chrome 拡張から送られてくるタブ情報を受け取る “取り込み口” モジュール。
+
+・拡張側で抽出したページ本文を受け取る（gzip 圧縮も可）
+  → Python 側でページを再ダウンロードしなくて済む
+・URL＋本文ハッシュで重複を捨てる
+・タブ切り替えの連打はデバウンスして最後の 1 件だけ確定
+・最近のタブはサイズ上限付きリングバッファに保持
+
+gemini.py と chrome_Extension/server.py の両方がこのモジュールを使う。
+"""
+
+import gzip
+import hashlib
+import io
+import json
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+# ======= 🎚️ 既定パラメータ =======
+DEBOUNCE_SEC = 0.5           # この秒数内の連続切り替えは最後の 1 件だけ採用
+RING_SIZE = 20               # 保持する最近のタブ数
+MAX_TEXT_CHARS = 20_000      # 本文の保存上限（文字数）
+MAX_BODY_BYTES = 2_000_000   # 解凍後ペイロードの上限（zip 爆弾対策）
+
+
+@dataclass
+class TabEntry:
+    """1 タブ分の情報"""
+    url: str
+    title: str = ""
+    text: str = ""
+    content_hash: str = ""
+    received_at: float = 0.0
+    seen: int = 1             # 重複受信を含めた受信回数
+
+
+@dataclass
+class IngestStats:
+    """取り込み統計（ロードテスト・デバッグ用）"""
+    received: int = 0         # 受信イベント総数
+    debounced: int = 0        # デバウンスで捨てた件数
+    duplicates: int = 0       # URL＋ハッシュ一致で捨てた件数
+    committed: int = 0        # リングバッファに確定した件数
+    evicted: int = 0          # 上限超過で追い出した件数
+    rejected: int = 0         # 不正ペイロード
+    bytes_in: int = 0         # 受信バイト数（圧縮状態のまま）
+
+    def as_dict(self) -> dict:
+        return dict(self.__dict__)
+
+
+def content_hash(text: str) -> str:
+    """本文ハッシュ（空本文は空文字）"""
+    if not text:
+        return ""
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def decode_payload(raw: bytes, content_encoding: str = "") -> dict:
+    """
+    リクエストボディ → dict
+    Content-Encoding: gzip のときは解凍してから JSON として読む。
+    不正な場合は ValueError。
+    """
+    if content_encoding.lower().strip() == "gzip":
+        try:
+            with gzip.GzipFile(fileobj=io.BytesIO(raw)) as gz:
+                raw = gz.read(MAX_BODY_BYTES + 1)
+        except (OSError, EOFError) as e:
+            raise ValueError(f"gzip 解凍に失敗: {e}") from e
+    if len(raw) > MAX_BODY_BYTES:
+        raise ValueError("ペイロードが大きすぎます")
+    try:
+        data = json.loads(raw.decode("utf-8")) if raw else {}
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ValueError(f"JSON として読めません: {e}") from e
+    if not isinstance(data, dict) or not data.get("url"):
+        raise ValueError("url がありません")
+    return data
+
+
+@dataclass
+class BrowserIngest:
+    """
+    🌐 ブラウザコンテキストの取り込みサービス
+    ----------------------------------------
+    ingest(payload) でイベントを受け取り、
+    latest() / recent() で現在・最近のタブを読む。
+
+    デバウンスはタイマースレッドを使わず「次のイベント or 読み出し時」に
+    保留中イベントの確定判定をする遅延方式。clock を差し替えれば
+    ロードテストで時間を早送りできる。
+    """
+    debounce_sec: float = DEBOUNCE_SEC
+    ring_size: int = RING_SIZE
+    max_text_chars: int = MAX_TEXT_CHARS
+    clock: callable = time.monotonic
+
+    stats: IngestStats = field(default_factory=IngestStats, init=False)
+    _ring: "OrderedDict[str, TabEntry]" = field(default_factory=OrderedDict, init=False, repr=False)
+    _pending: TabEntry | None = field(default=None, init=False, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False)
+
+    # ----------------------------
+    # 受信
+    # ----------------------------
+    def ingest(self, payload: dict, nbytes: int = 0) -> str:
+        """
+        1 イベントを取り込み、結果を "pending" / "duplicate" で返す。
+        （確定は後続イベント or 読み出し時に行う）
+        """
+        now = self.clock()
+        text = (payload.get("text") or "")[: self.max_text_chars]
+        entry = TabEntry(
+            url=payload["url"],
+            title=payload.get("title") or "",
+            text=text,
+            content_hash=content_hash(text),
+            received_at=now,
+        )
+        with self._lock:
+            self.stats.received += 1
+            self.stats.bytes_in += nbytes
+
+            pending = self._pending
+            if pending is not None:
+                if pending.url == entry.url and _same_content(pending, entry):
+                    # 同じタブの再送 → 保留中のものをそのまま延命
+                    pending.seen += 1
+                    pending.received_at = now
+                    if entry.title:
+                        pending.title = entry.title
+                    self.stats.duplicates += 1
+                    return "duplicate"
+                if now - pending.received_at < self.debounce_sec:
+                    # 連打中 → 前のイベントは捨てる
+                    self.stats.debounced += 1
+                else:
+                    self._commit(pending)
+            elif self._is_known(entry):
+                self._touch(entry)
+                self.stats.duplicates += 1
+                return "duplicate"
+
+            self._pending = entry
+            return "pending"
+
+    def reject(self) -> None:
+        """不正ペイロードを数える"""
+        with self._lock:
+            self.stats.rejected += 1
+
+    def flush(self) -> None:
+        """保留中イベントを強制確定（終了時・テスト用）"""
+        with self._lock:
+            if self._pending is not None:
+                self._commit(self._pending)
+
+    # ----------------------------
+    # 読み出し
+    # ----------------------------
+    def latest(self) -> TabEntry | None:
+        """
+        いま見ているタブ。
+        デバウンス中でも「最後に切り替えたタブ」を返す（ユーザーが見ているのはそれ）。
+        """
+        with self._lock:
+            self._settle()
+            if self._pending is not None:
+                return self._pending
+            if self._ring:
+                return next(reversed(self._ring.values()))
+            return None
+
+    def recent(self, limit: int | None = None) -> list[TabEntry]:
+        """確定済みの最近のタブ（新しい順）"""
+        with self._lock:
+            self._settle()
+            items = list(reversed(self._ring.values()))
+        return items[:limit] if limit else items
+
+    def __len__(self) -> int:
+        return len(self._ring)
+
+    # ----------------------------
+    # 内部処理（_lock 取得済み前提）
+    # ----------------------------
+    def _settle(self) -> None:
+        """デバウンス期間を過ぎた保留イベントを確定"""
+        pending = self._pending
+        if pending is not None and self.clock() - pending.received_at >= self.debounce_sec:
+            self._commit(pending)
+
+    def _is_known(self, entry: TabEntry) -> bool:
+        old = self._ring.get(entry.url)
+        return old is not None and _same_content(old, entry)
+
+    def _touch(self, entry: TabEntry) -> None:
+        old = self._ring[entry.url]
+        old.seen += 1
+        old.received_at = entry.received_at
+        if entry.title:
+            old.title = entry.title
+        self._ring.move_to_end(entry.url)
+
+    def _commit(self, entry: TabEntry) -> None:
+        self._pending = None
+        if self._is_known(entry):
+            self._touch(entry)
+            self.stats.duplicates += 1
+            return
+        old = self._ring.pop(entry.url, None)
+        if old is not None and not entry.text:
+            # タイトルだけの再送で本文を消さない
+            entry.text, entry.content_hash = old.text, old.content_hash
+        self._ring[entry.url] = entry
+        self.stats.committed += 1
+        while len(self._ring) > self.ring_size:
+            self._ring.popitem(last=False)
+            self.stats.evicted += 1
+
+
+def _same_content(a: TabEntry, b: TabEntry) -> bool:
+    """本文なしの再送は「同じ」とみなす（タイトル更新だけのイベント）"""
+    return not b.content_hash or a.content_hash == b.content_hash
+
+
+# ---------------------------------------------------------------------
+# 🌐 Flask ルート登録
+# ---------------------------------------------------------------------
+def register_routes(app, ingest: BrowserIngest, verbose: bool = False) -> None:
+    """/browser-data と /browser-data/stats を app に登録"""
+    from flask import request, jsonify
+
+    @app.route("/browser-data", methods=["POST"])
+    def browser_data_endpoint():
+        raw = request.get_data(cache=False)
+        try:
+            payload = decode_payload(raw, request.headers.get("Content-Encoding", ""))
+        except ValueError as e:
+            ingest.reject()
+            return str(e), 400
+        result = ingest.ingest(payload, nbytes=len(raw))
+        if verbose:
+            print(f"📂 受信ブラウザデータ: {payload.get('title', '')} ({result})")
+        return result, 200
+
+    @app.route("/browser-data/stats", methods=["GET"])
+    def browser_data_stats():
+        latest = ingest.latest()
+        return jsonify(
+            stats=ingest.stats.as_dict(),
+            buffered=len(ingest),
+            latest=latest.url if latest else None,
+        )
+
+
+def create_app(ingest: BrowserIngest | None = None, verbose: bool = False):
+    """取り込み専用の Flask アプリを作る（単体起動・ロードテスト用）"""
+    from flask import Flask
+    from flask_cors import CORS
+
+    app = Flask(__name__)
+    CORS(app)
+    register_routes(app, ingest or BrowserIngest(), verbose=verbose)
+    return app
@@ -0,0 +1,284 @@
+"""
+conversation_store.py
+---------------------
+会話ログの永続化＋全文検索モジュール。
+
+・SQLite に 1 ターン（user / assistant）ずつ保存
+・FTS5 の trigram トークナイザで日本語も部分一致検索できる
+・書き込みは専用スレッドで非同期に行う（応答生成の邪魔をしない）
+・起動時は直近の履歴を読み出して messages に戻せる
+・保持期間／件数の上限を超えた古いログは削除
+
+    store = ConversationStore("conversation_log.db")
+    store.append_async("明日の予定は？", "明日は10時から会議だよ")
+    store.search("会議")          # → [Turn(...), ...]
+"""
+
+import queue
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+# trigram は 3 文字未満の語では引けないので、その場合は LIKE で探す
+TRIGRAM_MIN_CHARS = 3
+
+# 「前に〜について話した？」系の問い合わせから話題を抜き出す
+RECALL_PATTERN = re.compile(
+    r"(?:前に|以前|この前|こないだ|昨日)\s*(?P<topic>.+?)\s*"
+    r"(?:について|のこと|の話)?\s*(?:話した|話してた|言った|言ってた|喋った)"
+)
+
+_STOP = object()   # 書き込みスレッド終了の合図
+RETENTION_INTERVAL_SEC = 3600   # 常駐中も 1 時間ごとに古いログを整理
+
+
+@dataclass
+class Turn:
+    """1 往復分の会話"""
+    ts: float
+    user: str
+    assistant: str
+
+
+def extract_recall_topic(text: str) -> str | None:
+    """『前に〜について話した？』なら『〜』を返す（該当しなければ None）"""
+    m = RECALL_PATTERN.search(text)
+    if not m:
+        return None
+    topic = m.group("topic").strip(" 、。？?")
+    topic = re.sub(r"^[のにでと]+|[のをはがにでと]+$", "", topic)   # 「この前の〜の話」の助詞を落とす
+    return topic or None
+
+
+class ConversationStore:
+    """
+    💾 会話ログストア
+    ----------------
+    retention_days : これより古いターンは削除（0 なら無期限）
+    max_turns      : 保存件数の上限（0 なら無制限）
+    """
+
+    def __init__(self, path, retention_days: float = 90, max_turns: int = 10_000):
+        self.path = Path(path)
+        self.retention_days = retention_days
+        self.max_turns = max_turns
+        self._queue: queue.Queue = queue.Queue()
+        self._read_conn: sqlite3.Connection | None = None
+        self._read_lock = threading.Lock()    # 読み取りは 1 本のコネクションを順番に使う
+        self._closed = False
+
+        conn = self._connect()
+        self.has_fts = self._init_schema(conn)
+        conn.close()
+
+        self._writer = threading.Thread(target=self._write_loop, daemon=True,
+                                        name="conversation-writer")
+        self._writer.start()
+
+    # ----------------------------
+    # 初期化
+    # ----------------------------
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")     # 読み書きを並行させる
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _init_schema(self, conn: sqlite3.Connection) -> bool:
+        """テーブル作成。trigram FTS が使えれば True"""
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS turns ("
+                " id INTEGER PRIMARY KEY,"
+                " ts REAL NOT NULL,"
+                " user TEXT NOT NULL,"
+                " assistant TEXT NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS turns_ts ON turns(ts)")
+        try:
+            with conn:
+                conn.execute(
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS turns_fts USING fts5("
+                    " user, assistant, content='turns', content_rowid='id',"
+                    " tokenize='trigram')"
+                )
+                # turns と索引を同期するトリガー
+                conn.execute(
+                    "CREATE TRIGGER IF NOT EXISTS turns_ai AFTER INSERT ON turns BEGIN"
+                    " INSERT INTO turns_fts(rowid, user, assistant)"
+                    " VALUES (new.id, new.user, new.assistant); END"
+                )
+                conn.execute(
+                    "CREATE TRIGGER IF NOT EXISTS turns_ad AFTER DELETE ON turns BEGIN"
+                    " INSERT INTO turns_fts(turns_fts, rowid, user, assistant)"
+                    " VALUES ('delete', old.id, old.user, old.assistant); END"
+                )
+            return True
+        except sqlite3.OperationalError as e:
+            # SQLite が古く trigram がない → LIKE 検索で代用
+            print("⚠️ 全文検索インデックスを作れませんでした:", e)
+            return False
+
+    # ----------------------------
+    # 書き込み（非同期）
+    # ----------------------------
+    def append_async(self, user: str, assistant: str, ts: float | None = None) -> None:
+        """1 往復をキューに積むだけ（即座に戻る）"""
+        self._queue.put(Turn(ts or time.time(), user, assistant))
+
+    def _retain(self, conn: sqlite3.Connection) -> None:
+        try:
+            self._apply_retention(conn)
+        except sqlite3.Error as e:
+            print("⚠️ 会話ログの整理に失敗:", e)
+
+    def _write_loop(self) -> None:
+        conn = self._connect()
+        self._retain(conn)
+        next_retention = time.monotonic() + RETENTION_INTERVAL_SEC
+        stop = False
+        while not stop:
+            if time.monotonic() >= next_retention:
+                self._retain(conn)
+                next_retention = time.monotonic() + RETENTION_INTERVAL_SEC
+            try:
+                # 無会話の時間帯でも整理できるよう、一定時間で起きる
+                batch = [self._queue.get(timeout=max(next_retention - time.monotonic(), 0.0))]
+            except queue.Empty:
+                continue
+            # 溜まっている分はまとめて 1 トランザクションで書く
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            turns = [t for t in batch if t is not _STOP]
+            stop = len(turns) != len(batch)
+            if turns:
+                try:
+                    with conn:
+                        conn.executemany(
+                            "INSERT INTO turns(ts, user, assistant) VALUES (?, ?, ?)",
+                            [(t.ts, t.user, t.assistant) for t in turns],
+                        )
+                except sqlite3.Error as e:
+                    print("⚠️ 会話ログ保存エラー:", e)
+            for _ in batch:
+                self._queue.task_done()
+        conn.close()
+
+    def flush(self) -> None:
+        """キューに積んだ分が書き終わるまで待つ"""
+        self._queue.join()
+
+    def close(self) -> None:
+        """書き込みを済ませてからスレッドとコネクションを畳む（2 回呼んでもよい）"""
+        with self._read_lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._queue.put(_STOP)
+        self._writer.join()
+        with self._read_lock:
+            if self._read_conn is not None:
+                self._read_conn.close()
+                self._read_conn = None
+
+    # ----------------------------
+    # 保持ポリシー
+    # ----------------------------
+    def _apply_retention(self, conn: sqlite3.Connection) -> int:
+        """期間・件数の上限を超えた古いターンを削除し、削除件数を返す"""
+        deleted = 0
+        with conn:
+            if self.retention_days:
+                cutoff = time.time() - self.retention_days * 86_400
+                deleted += conn.execute("DELETE FROM turns WHERE ts < ?", (cutoff,)).rowcount
+            if self.max_turns:
+                deleted += conn.execute(
+                    "DELETE FROM turns WHERE id NOT IN"
+                    " (SELECT id FROM turns ORDER BY ts DESC LIMIT ?)",
+                    (self.max_turns,),
+                ).rowcount
+        return deleted
+
+    # ----------------------------
+    # 読み出し
+    # ----------------------------
+    def _reader(self) -> sqlite3.Connection:
+        """読み取り用コネクション（_read_lock を持って呼ぶ）"""
+        if self._read_conn is None:
+            self._read_conn = self._connect()
+        return self._read_conn
+
+    def recent(self, limit: int = 15) -> list[Turn]:
+        """直近 limit 往復（古い順）"""
+        with self._read_lock:
+            rows = self._reader().execute(
+                "SELECT ts, user, assistant FROM turns ORDER BY ts DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [Turn(*r) for r in reversed(rows)]
+
+    def search(self, query: str, limit: int = 3, include_recall: bool = False) -> list[Turn]:
+        """
+        query を含む過去の往復を関連度順に返す。
+        空白区切りの語はすべて含むもの（AND）。
+        『前に〜について話した？』という問い合わせ自体のターンは既定で除く
+        （前回の問い合わせが次の検索に引っかかり続けないように）。
+        """
+        terms = [t for t in query.split() if t]
+        if not terms:
+            return []
+        long_terms = [t for t in terms if len(t) >= TRIGRAM_MIN_CHARS]
+        if not (self.has_fts and long_terms):
+            long_terms = []
+        like_terms = [t for t in terms if t not in long_terms]
+        where = [_LIKE_CLAUSE] * len(like_terms)
+        args = [f"%{_escape_like(t)}%" for t in like_terms]
+
+        if long_terms:
+            match = " AND ".join('"' + t.replace('"', '""') + '"' for t in long_terms)
+            sql = (
+                "SELECT t.ts, t.user, t.assistant FROM turns_fts"
+                " JOIN turns t ON t.id = turns_fts.rowid"
+                " WHERE " + " AND ".join(["turns_fts MATCH ?", *where])
+                + " ORDER BY turns_fts.rank, t.ts DESC"
+            )
+            args = [match, *args]
+        else:
+            sql = (
+                "SELECT t.ts, t.user, t.assistant FROM turns t"
+                " WHERE " + " AND ".join(where) + " ORDER BY t.ts DESC"
+            )
+        hits = []
+        with self._read_lock:
+            cur = self._reader().execute(sql, args)
+            try:
+                for row in cur:                 # 除外があるので LIMIT は使わず limit 件で打ち切る
+                    turn = Turn(*row)
+                    if include_recall or not extract_recall_topic(turn.user):
+                        hits.append(turn)
+                        if len(hits) >= limit:
+                            break
+            finally:
+                cur.close()                     # 読みかけのままだと WAL のスナップショットが残る
+        return hits
+
+
+_LIKE_CLAUSE = "(t.user || ' ' || t.assistant) LIKE ? ESCAPE '\\'"
+
+
+def _escape_like(term: str) -> str:
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def format_recall(turns: list[Turn]) -> str:
+    """検索結果をプロンプトに差し込む文字列に整形"""
+    lines = ["参考: 以前のユーザーとの会話ログです（必要なら踏まえて答えてね）。"]
+    for t in turns:
+        day = time.strftime("%Y-%m-%d", time.localtime(t.ts))
+        lines.append(f"[{day}] ユーザー: {t.user}\n[{day}] アシスタント: {t.assistant}")
+    return "\n".join(lines)
@@ -0,0 +1,262 @@
+"""
+fake_backends.py
+----------------
+resilience.py を試すためのローカル・フェイクサーバー。
+遅延（テール付き）とエラーを注入できる。
+
+    python fake_backends.py                 # 全シナリオを実行して結果を表示
+    python fake_backends.py --serve 10101   # AIVISpeech の代わりに常駐
+                                            # （gemini.py 側は AIVIS_URL=http://127.0.0.1:10101）
+
+提供するエンドポイント
+    POST /audio_query   AIVISpeech 互換（JSON を返す）
+    POST /synthesis     AIVISpeech 互換（無音 WAV を返す）
+    POST /generate      Gemini 代わり（{"text": ...} を返す）
+"""
+
+import argparse
+import io
+import json
+import random
+import threading
+import time
+import wave
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from resilience import (
+    BackendUnavailable, CircuitBreaker, CircuitOpen, DeadlineExceeded, ResilientBackend,
+)
+
+
+@dataclass
+class Faults:
+    """注入する障害（実行中に書き換えてよい）"""
+    base_latency: float = 0.02     # 通常の応答秒
+    tail_latency: float = 0.0      # テール時の応答秒
+    tail_rate: float = 0.0         # テールになる確率
+    error_rate: float = 0.0        # 500 を返す確率
+    down: bool = False             # True なら全部 503
+
+    def delay(self, rng: random.Random) -> float:
+        return self.tail_latency if rng.random() < self.tail_rate else self.base_latency
+
+
+def _silent_wav(sec: float = 0.1, rate: int = 24_000) -> bytes:
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(b"\x00\x00" * int(rate * sec))
+    return buf.getvalue()
+
+
+class FakeServer:
+    """バックグラウンドスレッドで動くフェイク HTTP サーバー"""
+
+    def __init__(self, port: int = 0, faults: Faults | None = None, seed: int = 0):
+        self.faults = faults or Faults()
+        self.requests = 0
+        rng = random.Random(seed)
+        rng_lock = threading.Lock()
+        server = self
+        wav = _silent_wav()
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                self.rfile.read(length)
+                server.requests += 1
+                f = server.faults
+                with rng_lock:
+                    delay, fail = f.delay(rng), rng.random() < f.error_rate
+                if f.down:
+                    return self._reply(503, b"down", "text/plain")
+                time.sleep(delay)
+                if fail:
+                    return self._reply(500, b"injected error", "text/plain")
+                path = self.path.split("?", 1)[0]
+                if path == "/audio_query":
+                    return self._reply(200, b'{"speedScale": 1.0}', "application/json")
+                if path == "/synthesis":
+                    return self._reply(200, wav, "audio/wav")
+                if path == "/generate":
+                    body = json.dumps({"text": "フェイク応答だよ"}, ensure_ascii=False)
+                    return self._reply(200, body.encode("utf-8"), "application/json")
+                return self._reply(404, b"not found", "text/plain")
+
+            def _reply(self, code, body, ctype):
+                self.send_response(code)
+                self.send_header("Content-Type", ctype)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self._httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self._httpd.server_address[1]}"
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+# ---------------------------------------------------------------------
+# 🧪 シナリオ
+# ---------------------------------------------------------------------
+def _post(url: str, timeout: float) -> bytes:
+    res = requests.post(url, timeout=timeout)
+    res.raise_for_status()
+    return res.content
+
+
+def _run_calls(backend: ResilientBackend, url: str, n: int) -> tuple[list[float], int]:
+    latencies, failures = [], 0
+    for _ in range(n):
+        t0 = time.perf_counter()
+        try:
+            backend.call(_post, url, backend.deadline)
+        except (BackendUnavailable, requests.RequestException):
+            failures += 1
+        latencies.append(time.perf_counter() - t0)
+    return latencies, failures
+
+
+def _pct(values: list[float], p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+def scenario_hedging(n: int = 200) -> None:
+    """2% が 1 秒かかるテール → ヘッジで p99 が縮むこと"""
+    faults = Faults(base_latency=0.02, tail_latency=1.0, tail_rate=0.02)
+    with FakeServer(faults=faults) as srv:
+        url = f"{srv.url}/synthesis"
+        plain = ResilientBackend("plain", deadline=5.0, hedge=False)
+        hedged = ResilientBackend("hedged", deadline=5.0, hedge=True)
+        _run_calls(hedged, url, hedged.hedge_min_samples)   # p95 が出るまで慣らし
+        lat_plain, _ = _run_calls(plain, url, n)
+        lat_hedged, _ = _run_calls(hedged, url, n)
+    print(f"🪄 ヘッジ  p99 {_pct(lat_plain, 0.99) * 1e3:.0f}ms → {_pct(lat_hedged, 0.99) * 1e3:.0f}ms"
+          f"（2 本目 {hedged.hedges_sent} 回）")
+    assert _pct(lat_hedged, 0.99) < _pct(lat_plain, 0.99)
+
+
+def scenario_deadline() -> None:
+    """応答が 2 秒かかるサーバー → 0.3 秒で DeadlineExceeded"""
+    with FakeServer(faults=Faults(base_latency=2.0)) as srv:
+        backend = ResilientBackend("slow", deadline=0.3, hedge=False)
+        t0 = time.perf_counter()
+        try:
+            backend.call(_post, f"{srv.url}/generate", 2.5)
+            raise AssertionError("デッドラインが効いていない")
+        except DeadlineExceeded:
+            pass
+        elapsed = time.perf_counter() - t0
+    print(f"⏰ デッドライン  {elapsed * 1e3:.0f}ms で打ち切り")
+    assert elapsed < 0.5
+
+
+def scenario_circuit() -> None:
+    """落ちたサーバー → 3 回失敗でサーキット open、以降は即失敗 → 復旧後に half_open で戻る"""
+    with FakeServer(faults=Faults(down=True)) as srv:
+        breaker = CircuitBreaker(failure_threshold=3, reset_timeout=0.5)
+        backend = ResilientBackend("down", deadline=1.0, hedge=False, breaker=breaker)
+        url = f"{srv.url}/audio_query"
+        _run_calls(backend, url, 3)
+        assert breaker.state == "open"
+
+        sent = srv.requests
+        t0 = time.perf_counter()
+        try:
+            backend.call(_post, url, 1.0)
+            raise AssertionError("サーキットが開いていない")
+        except CircuitOpen:
+            pass
+        fast = time.perf_counter() - t0
+        assert srv.requests == sent, "open 中にリクエストが飛んだ"
+
+        srv.faults.down = False
+        time.sleep(0.6)
+        backend.call(_post, url, 1.0)
+        assert breaker.state == "closed"
+    print(f"🔌 サーキット  open 中は {fast * 1e6:.0f}µs で即失敗、復旧後 closed に戻った")
+
+
+def scenario_flaky(n: int = 200) -> None:
+    """10% が 500 → 散発エラーでブレーカーが開いても短時間で戻ること"""
+    with FakeServer(faults=Faults(error_rate=0.10)) as srv:
+        breaker = CircuitBreaker(failure_threshold=3, reset_timeout=0.2)
+        backend = ResilientBackend("flaky", deadline=1.0, breaker=breaker)
+        _, failures = _run_calls(backend, f"{srv.url}/synthesis", n)
+    print(f"🎲 エラー注入  {failures}/{n} 失敗、最終状態 {breaker.state}")
+    assert failures < n // 4
+
+
+def scenario_overload(workers: int = 4) -> None:
+    """
+    健全だが 0.2 秒かかるサーバーにプールより多い同時呼び出し（デッドライン 0.3 秒）
+    ・2 倍まで → 空き待ちはデッドラインに数えないので全部成功
+    ・4 倍    → 待ちすぎた分は DeadlineExceeded だが、サーキットは開かない
+    """
+    from concurrent.futures import ThreadPoolExecutor as Clients
+
+    def burst(backend, url, callers):
+        with Clients(max_workers=callers) as clients:
+            results = list(clients.map(lambda _: _run_calls(backend, url, 1), range(callers)))
+        return sum(f for _, f in results)
+
+    with FakeServer(faults=Faults(base_latency=0.2)) as srv:
+        url = f"{srv.url}/generate"
+        backend = ResilientBackend("busy", deadline=0.3, hedge=False, max_workers=workers)
+        ok_failures = burst(backend, url, workers * 2)
+        backend = ResilientBackend("jammed", deadline=0.3, hedge=False, max_workers=workers)
+        jam_failures = burst(backend, url, workers * 4)
+    print(f"🚦 混雑  プール {workers} 本：同時 {workers * 2} 本で {ok_failures} 件失敗 / "
+          f"同時 {workers * 4} 本で空き待ち打ち切り {backend.queue_timeouts} 件、"
+          f"サーキット {backend.breaker.state}")
+    assert ok_failures == 0
+    assert jam_failures == backend.queue_timeouts > 0 and backend.breaker.state == "closed"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="resilience.py 用フェイクサーバー")
+    parser.add_argument("--serve", type=int, help="指定ポートで常駐（AIVISpeech 代わり）")
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--tail-latency", type=float, default=3.0)
+    parser.add_argument("--tail-rate", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    if args.serve:
+        faults = Faults(args.latency, args.tail_latency, args.tail_rate, args.error_rate)
+        with FakeServer(port=args.serve, faults=faults) as srv:
+            print(f"🧪 フェイクサーバー起動: {srv.url}（Ctrl+C で終了）")
+            try:
+                while True:
+                    time.sleep(1)
+            except KeyboardInterrupt:
+                pass
+        return
+
+    scenario_deadline()
+    scenario_circuit()
+    scenario_hedging()
+    scenario_flaky()
+    scenario_overload()
+    print("✅ OK")
+
+
+if __name__ == "__main__":
+    main()
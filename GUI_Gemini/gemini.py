@@ -19,6 +19,7 @@ assistant_ai.py
     Flask==3.0.2
     flask-cors==4.0.0
     beautifulsoup4==4.12.3
+    websockets==12.0         # サーバーモード（assistant_server.py）のみ
 """
 
 # ======= 📦 標準／外部モジュール =======
@@ -26,16 +27,14 @@ import os
 import time
 import json
 import re
+import shutil
 import tempfile
 import threading
 from pathlib import Path
 from datetime import datetime, timedelta
 
 import numpy as np
-import sounddevice as sd
-import soundfile as sf
 import requests
-import keyboard
 import feedparser
 from bs4 import BeautifulSoup
 
@@ -45,9 +44,16 @@ import google.generativeai as genai
 import google.genai                   # ✅ Gemini SDK
 from duckduckgo_search import DDGS
 
-from flask import Flask, request
+from flask import Flask
 from flask_cors import CORS
 
+from browser_ingest import BrowserIngest, register_routes
+from resilience import BackendUnavailable, ResilientBackend
+from conversation_store import ConversationStore, extract_recall_topic, format_recall
+from tiered_recognizer import TieredRecognizer
+# sounddevice / soundfile / keyboard は手元で録音・再生するときだけ使うので関数内で import
+# （サーバーモードのホストに PortAudio やキーボードフックがなくても読み込めるように）
+
 # ======= 🔧 環境変数ロード =======
 load_dotenv()
 GENAI_API_KEY = os.getenv("GOOGLE_API_KEY")
@@ -57,9 +63,30 @@ OPENWEATHER_API_KEY = os.getenv("OPENWEATHER_API_KEY")
 genai.configure(api_key=GENAI_API_KEY)
 GEMINI_MODEL = genai.GenerativeModel("gemini-2.0-flash")  # ← ここでモデル指定
 
+# ======= 🛡️ 遅延対策（デッドライン／ヘッジ／サーキットブレーカー） =======
+GEMINI_DEADLINE_SEC = float(os.getenv("GEMINI_DEADLINE_SEC", "20"))
+AIVIS_DEADLINE_SEC  = float(os.getenv("AIVIS_DEADLINE_SEC", "10"))
+AIVIS_DEADLINE_PER_CHAR = float(os.getenv("AIVIS_DEADLINE_PER_CHAR", "0.05"))  # 長文ほど合成に時間がかかる分
+AIVIS_URL = os.getenv("AIVIS_URL", "http://127.0.0.1:10101")   # フェイクサーバーに向けるときは差し替え
+gemini_backend = ResilientBackend("gemini", deadline=GEMINI_DEADLINE_SEC)
+# 合成時間は文の長さで大きく変わり p95 が当てにならない上、エンジンは手元の 1 台だけ
+# → 2 本目を投げても負荷が増えるだけなのでヘッジしない
+aivis_backend  = ResilientBackend("aivis",  deadline=AIVIS_DEADLINE_SEC, hedge=False)
+
+def aivis_deadline(text: str) -> float:
+    """文の長さに合わせた AIVISpeech のデッドライン秒"""
+    return AIVIS_DEADLINE_SEC + len(text) * AIVIS_DEADLINE_PER_CHAR
+
 # ======= 🔧 Whisper 初期化 =======
 whisper_model = WhisperModel("medium", device="cuda", compute_type="float16")
 
+# ======= ⚡ 2 段認識（短いコマンドは小モデルだけで答える） =======
+TIERED_ASR = os.getenv("TIERED_ASR", "1") == "1"                       # 0 で medium のみ
+FAST_WHISPER_MODEL = os.getenv("FAST_WHISPER_MODEL", "base")            # tiny / base
+FAST_WHISPER_DEVICE = os.getenv("FAST_WHISPER_DEVICE", "cuda")
+FAST_TIER_MIN_CONFIDENCE = float(os.getenv("FAST_TIER_MIN_CONFIDENCE", "0.6"))
+TIERED_ASR_SPECULATIVE = os.getenv("TIERED_ASR_SPECULATIVE", "0") == "1"  # 1 で medium も並行で先行実行（GPU に余裕があるとき）
+
 # ======= 🧠 記憶管理ファイル =======
 MEMORY_FILE = Path("gpt_memory.json")
 MEMORY_LOCK = threading.Lock()   # 同時書き込み対策
@@ -73,11 +100,34 @@ SAMPLE_RATE = 44_100
 # ======= 🌐 Flask（ブラウザ共有） =======
 app = Flask(__name__)
 CORS(app)
-browser_data: dict = {}
+browser_ingest = BrowserIngest()   # 拡張から届いたタブ（デバウンス・重複排除済み）
 
 # ======= 💬 会話履歴（deque で上限 30） =======
 from collections import deque
 messages = deque(maxlen=30)  # {"role": "...", "content": "..."}
+HISTORY_LOCK = threading.Lock()   # 起動時の履歴復元と get_gpt_reply の読み書きを直列化
+
+# ======= 💾 会話ログ（SQLite＋全文検索、再起動しても残る） =======
+CONVERSATION_DB = Path(os.getenv("CONVERSATION_DB", "conversation_log.db"))
+CONVERSATION_RETENTION_DAYS = float(os.getenv("CONVERSATION_RETENTION_DAYS", "90"))  # 0 で無期限
+CONVERSATION_MAX_TURNS = int(os.getenv("CONVERSATION_MAX_TURNS", "10000"))           # 0 で無制限
+conversation_store = None   # start_local_services() で開く（サーバーモードはセッションごと）
+
+def restore_history():
+    """前回までの直近履歴を messages に戻す（起動直後の 1 ターン目を待たせないよう別スレッドで）"""
+    try:
+        restored = []
+        for t in conversation_store.recent(messages.maxlen // 2):
+            restored.append({"role": "user",      "content": t.user})
+            restored.append({"role": "assistant", "content": t.assistant})
+    except Exception as e:
+        print("⚠️ 会話履歴の復元に失敗:", e)
+        return
+    # 復元中にもう会話が始まっていたら、その分を後ろに残す
+    with HISTORY_LOCK:
+        current = list(messages)
+        messages.clear()
+        messages.extend(restored + current)
 
 # ======= 🏁 アプリ稼働フラグ =======
 is_running = True   # ESC で False に
@@ -85,54 +135,54 @@ is_running = True   # ESC で False に
 # ---------------------------------------------------------------------
 # 🧠 記憶ヘルパ
 # ---------------------------------------------------------------------
-def load_persona() -> str:
+def load_persona(memory_file: Path = MEMORY_FILE) -> str:
     """JSON からユーザー記憶を読み取り、システムプロンプト用文字列に変換"""
-    if not MEMORY_FILE.exists():
+    if not memory_file.exists():
         return ""
-    with open(MEMORY_FILE, encoding="utf-8") as f:
+    with open(memory_file, encoding="utf-8") as f:
         memory_data = json.load(f)
     memory_lines = [f"{k}：{v}" for k, v in memory_data.items()]
     return "これは覚えておくべきユーザー情報です。\n" + "\n".join(memory_lines)
 
-def save_persona(new_data: dict):
+def save_persona(new_data: dict, memory_file: Path = MEMORY_FILE):
     """記憶 JSON に key:value を追加／更新（排他制御付き）"""
     with MEMORY_LOCK:
         memory_data = {}
-        if MEMORY_FILE.exists():
-            with open(MEMORY_FILE, encoding="utf-8") as f:
+        if memory_file.exists():
+            with open(memory_file, encoding="utf-8") as f:
                 memory_data = json.load(f)
         memory_data.update(new_data)
-        with open(MEMORY_FILE, "w", encoding="utf-8") as f:
+        with open(memory_file, "w", encoding="utf-8") as f:
             json.dump(memory_data, f, indent=2, ensure_ascii=False)
 
-def handle_memory_command(user_text: str):
-    """『覚えて～』『これは忘れて～』『～って覚えてる？』を処理"""
+def handle_memory_command(user_text: str, memory_file: Path = MEMORY_FILE):
+    """『覚えて～』『これは忘れて～』『～って覚えてる？』を処理（memory_file はセッションごとに差し替え可）"""
     try:
         if user_text.startswith("覚えて"):
             info = user_text.replace("覚えて", "").strip()
             if "は" in info:
                 key, value = info.split("は", 1)
-                save_persona({key.strip(): value.strip()})
+                save_persona({key.strip(): value.strip()}, memory_file)
                 return f"うん、{key.strip()}は『{value.strip()}』って覚えたよ！"
             return "うーん、なんて覚えればいいか分かんなかった..."
 
         if user_text.startswith("これは忘れて"):
             key = user_text.replace("これは忘れて", "").strip()
             with MEMORY_LOCK:
-                if MEMORY_FILE.exists():
-                    with open(MEMORY_FILE, encoding="utf-8") as f:
+                if memory_file.exists():
+                    with open(memory_file, encoding="utf-8") as f:
                         memory_data = json.load(f)
                     if key in memory_data:
                         del memory_data[key]
-                        with open(MEMORY_FILE, "w", encoding="utf-8") as f:
+                        with open(memory_file, "w", encoding="utf-8") as f:
                             json.dump(memory_data, f, indent=2, ensure_ascii=False)
                         return f"『{key}』って記憶は消したよ"
             return f"『{key}』って記憶はなかったみたい"
 
         if user_text.endswith("って覚えてる？"):
             key = user_text.replace("って覚えてる？", "").strip()
-            if MEMORY_FILE.exists():
-                with open(MEMORY_FILE, encoding="utf-8") as f:
+            if memory_file.exists():
+                with open(memory_file, encoding="utf-8") as f:
                     memory_data = json.load(f)
                 if key in memory_data:
                     return f"うん、『{key}』は『{memory_data[key]}』って覚えてるよ！"
@@ -221,6 +271,19 @@ def handle_search_command(text):
         return get_daily_weather()
     return None
 
+def detect_command_intent(text: str):
+    """
+    route_reply が Gemini を呼ばずに答えるコマンドなら種別を返す
+    （2 段認識で小モデルの結果を採用してよいかの判定用。条件は各 handle_* と揃える）
+    """
+    if text.startswith(("覚えて", "これは忘れて")) or text.endswith("って覚えてる？"):
+        return "memory"
+    if "ニュース" in text or "天気" in text:
+        return "search"
+    if "ページの情報を教えて" in text:
+        return "browser"
+    return None
+
 # ---------------------------------------------------------------------
 # 🤖 Gemini 応答生成
 # ---------------------------------------------------------------------
@@ -245,27 +308,58 @@ def to_chat_history(msgs):
         chat.append({"role": role, "parts": [m["content"]]})
     return chat
 
-def get_gpt_reply(user_input: str) -> str:
+def generate_with_deadline(contents):
+    """GEMINI_MODEL.generate_content をデッドライン＋ヘッジ＋ブレーカー越しに呼ぶ"""
+    return gemini_backend.call(
+        GEMINI_MODEL.generate_content, contents,
+        request_options={"timeout": GEMINI_DEADLINE_SEC},
+    )
+
+def get_gpt_reply(user_input: str, history=None, memory_file: Path = MEMORY_FILE,
+                  store=None, system_prompt: str = SYSTEM_PROMPT) -> str:
+    """
+    history / memory_file / store を渡すとそのセッションの履歴・記憶・ログを使う
+    （省略時はローカル 1 人用の messages / MEMORY_FILE / conversation_store）
+    """
+    history = messages if history is None else history
+    store = conversation_store if store is None else store
+
     # 🧠 記憶をロード
-    memory = load_persona()          # 空なら ""
+    memory = load_persona(memory_file)   # 空なら ""
 
     # ① 1 本目の user メッセージにシステム指示+記憶を詰め込む
-    preamble = SYSTEM_PROMPT + ("\n" + memory if memory else "")
+    preamble = system_prompt + ("\n" + memory if memory else "")
+
+    # 『前に〜について話した？』なら過去ログから該当のやり取りを添える
+    if store is not None and (topic := extract_recall_topic(user_input)):
+        try:
+            if hits := store.search(topic):
+                preamble += "\n\n" + format_recall(hits)
+        except Exception as e:
+            print("⚠️ 会話ログ検索エラー:", e)
 
     # ② 直近履歴を user/model 形式で用意
     chat_history = [{"role": "user", "parts": [preamble]}]
-    chat_history += to_chat_history(messages)
+    with HISTORY_LOCK:
+        chat_history += to_chat_history(history)
     chat_history.append({"role": "user", "parts": [user_input]})
 
     try:
-        response = GEMINI_MODEL.generate_content(chat_history)
+        response = generate_with_deadline(chat_history)
         reply = response.text.strip()
 
         # ③ 履歴を更新（deque なので自動で古い分は捨てる）
-        messages.append({"role": "user",      "content": user_input})
-        messages.append({"role": "assistant", "content": reply})
+        with HISTORY_LOCK:
+            history.append({"role": "user",      "content": user_input})
+            history.append({"role": "assistant", "content": reply})
+        if store is not None:
+            store.append_async(user_input, reply)   # 保存は別スレッド
         return reply
 
+    except BackendUnavailable as e:
+        # 待たせずに縮退（定型文は定型音声キャッシュで即再生できる）
+        print("⚠️ Gemini 縮退モード:", e)
+        return CANNED_PHRASES["gemini_down"]
     except Exception as e:
         return f"⚠️ Gemini 応答生成エラー: {e}"
 
@@ -275,18 +369,23 @@ def get_gpt_reply(user_input: str) -> str:
 # 🎙️ 録音 → Whisper 文字起こし
 # ---------------------------------------------------------------------
 def smart_record(max_duration=8): # 録音時間（秒）
+    import keyboard
+    import sounddevice as sd
+    import soundfile as sf
     print("🎤音声入力開始")
     buffer, is_recording, silence_start = [], False, None
     stop_requested = False
+    finished = threading.Event()   # 録音が終わったら監視スレッドも畳む
 
     def monitor_stop_key():
         nonlocal stop_requested
-        while True:
+        while not finished.is_set():
             if keyboard.is_pressed("F2"):
                 stop_requested = True
                 break
-            time.sleep(0.1)
-    threading.Thread(target=monitor_stop_key, daemon=True).start()
+            finished.wait(0.1)
+    monitor = threading.Thread(target=monitor_stop_key, daemon=True)
+    monitor.start()
 
     def callback(indata, frames, time_info, status):
         nonlocal is_recording, silence_start, buffer
@@ -307,101 +406,243 @@ def smart_record(max_duration=8): # 録音時間（秒）
             print("🔁 音声入力終了")
             raise sd.CallbackStop()
 
-    with sd.InputStream(callback=callback, samplerate=SAMPLE_RATE, channels=1):
-        try:
-            sd.sleep(int(max_duration * 1000))
-        except sd.CallbackStop:
-            pass
+    try:
+        with sd.InputStream(callback=callback, samplerate=SAMPLE_RATE, channels=1):
+            try:
+                sd.sleep(int(max_duration * 1000))
+            except sd.CallbackStop:
+                pass
+    finally:
+        finished.set()
+        monitor.join()
 
     if not buffer:
         return None
     audio_data = np.concatenate(buffer, axis=0)
-    tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".wav")
-    sf.write(tmp.name, audio_data, SAMPLE_RATE)
-    return tmp.name
+    fd, path = tempfile.mkstemp(suffix=".wav")
+    os.close(fd)
+    sf.write(path, audio_data, SAMPLE_RATE)
+    return path
+
+# 2 段認識は手元のマイクで使うときだけ要るので、最初に使うときに作る
+# （サーバーモードは WhisperBatcher を使うため小モデルを読み込まない）
+_tiered_recognizer = None
+_tiered_recognizer_lock = threading.Lock()
+
+def get_tiered_recognizer():
+    """
+    2 段認識器を返す（初回だけ小モデルを読み込んで温める / 無効なら None）
+    小モデルが読めなければ（オフラインで未ダウンロード、GPU が int8 非対応など）
+    1 度だけ警告して 2 段認識を切り、以後は medium だけで認識する
+    """
+    global _tiered_recognizer, TIERED_ASR
+    with _tiered_recognizer_lock:
+        if not TIERED_ASR:
+            return None
+        if _tiered_recognizer is None:
+            try:
+                _tiered_recognizer = TieredRecognizer(
+                    whisper_model,
+                    WhisperModel(FAST_WHISPER_MODEL, device=FAST_WHISPER_DEVICE, compute_type="int8"),
+                    detect_command_intent,
+                    min_confidence=FAST_TIER_MIN_CONFIDENCE,
+                    speculative=TIERED_ASR_SPECULATIVE,
+                )
+            except Exception as e:
+                print(f"⚠️ 小モデル（{FAST_WHISPER_MODEL}）を読み込めないので medium だけで認識します:", e)
+                TIERED_ASR = False
+                return None
+        return _tiered_recognizer
 
 def transcribe_audio(path: str) -> str:
-    """Whisper で文字起こし"""
-    segments, _ = whisper_model.transcribe(path)
-    return " ".join(s.text.strip() for s in segments)
+    """Whisper で文字起こし（2 段認識が有効なら小モデル → 必要なときだけ medium）"""
+    tiered_recognizer = get_tiered_recognizer()
+    if tiered_recognizer is None:
+        segments, _ = whisper_model.transcribe(path)
+        return " ".join(s.text.strip() for s in segments)
+
+    result = tiered_recognizer.recognize(path)
+    if result.tier == "fast":
+        print(f"⚡ 小モデルで確定（{result.intent} / 確信度 {result.confidence:.2f}"
+              f" / 約 {result.saved_sec * 1000:.0f}ms 短縮）")
+    else:
+        print(f"🐢 medium で認識（{result.total_sec * 1000:.0f}ms）")
+    return result.text
 
 # ---------------------------------------------------------------------
 # 🗣️ AIVISpeech 音声合成 → 再生
 # ---------------------------------------------------------------------
-def synthesize_voice(text: str, speaker=1325133120, speed=1.2, volume=0.3):
-    """AIVISpeech エンジンで WAV を生成しパスを返す"""
+# 縮退モードで流す定型文（音声はエンジンが生きているうちにキャッシュしておく）
+CANNED_PHRASES = {
+    "gemini_down": "ごめんね、いまGeminiに繋がらないみたい。少し待ってからもう一回話しかけてね。",
+    "voice_down":  "ごめん、うまく声が出せないみたい。返事は画面に文字で出すね。",
+}
+CANNED_DIR = Path(os.getenv("CANNED_VOICE_DIR", Path(__file__).parent / "cache" / "canned"))
+DEFAULT_SPEAKER = 1325133120
+
+# GUI に文字で出すための直近の発話（縮退時はこれを表示）
+last_spoken_text = ""
+last_voice_degraded = False
+
+def _synthesize_once(text: str, speaker=DEFAULT_SPEAKER, speed=1.2, volume=0.3) -> bytes:
+    """AIVISpeech に 1 回問い合わせて WAV バイト列を返す（失敗は例外）"""
+    timeout = aivis_deadline(text)
+    query = requests.post(
+        f"{AIVIS_URL}/audio_query",
+        params={"text": text, "speaker": speaker},
+        timeout=timeout,
+    )
+    query.raise_for_status()
+    query = query.json()
+    query.update(speedScale=speed, volumeScale=volume)
+    audio = requests.post(
+        f"{AIVIS_URL}/synthesis",
+        params={"speaker": speaker}, json=query,
+        timeout=timeout,
+    )
+    audio.raise_for_status()
+    return audio.content
+
+def _canned_path(key: str, speaker=DEFAULT_SPEAKER) -> Path:
+    return CANNED_DIR / f"{key}_{speaker}.wav"
+
+def canned_voice(key: str, speaker=DEFAULT_SPEAKER) -> str | None:
+    """キャッシュ済み定型音声の “使い捨てコピー” を返す（play_voice が消すため）"""
+    src = _canned_path(key, speaker)
+    if not src.exists():
+        return None
+    fd, dst = tempfile.mkstemp(suffix=".wav")
+    os.close(fd)
+    shutil.copyfile(src, dst)
+    return dst
+
+def warm_canned_voices(retries=5, interval=5.0, speaker=DEFAULT_SPEAKER):
+    """定型音声を未キャッシュ分だけ合成して保存（エンジン起動待ちのため数回リトライ）"""
+    for _ in range(retries):
+        missing = [k for k in CANNED_PHRASES if not _canned_path(k, speaker).exists()]
+        if not missing:
+            return
+        try:
+            CANNED_DIR.mkdir(parents=True, exist_ok=True)
+            for key in missing:
+                _canned_path(key, speaker).write_bytes(
+                    _synthesize_once(CANNED_PHRASES[key], speaker)
+                )
+        except Exception as e:
+            print("⚠️ 定型音声キャッシュ失敗:", e)
+            time.sleep(interval)
+
+def synthesize_voice(text: str, speaker=DEFAULT_SPEAKER, speed=1.2, volume=0.3):
+    """
+    AIVISpeech エンジンで WAV を生成しパスを返す。
+    エンジンが遅い／落ちているときは定型音声（なければ None）で即返す。
+    """
+    global last_spoken_text, last_voice_degraded
+    last_spoken_text, last_voice_degraded = text, False
+
+    for key, phrase in CANNED_PHRASES.items():
+        if text == phrase and (path := canned_voice(key, speaker)):
+            return path
+
     try:
-        query = requests.post(
-            "http://127.0.0.1:10101/audio_query",
-            params={"text": text, "speaker": speaker}
-        ).json()
-        query.update(speedScale=speed, volumeScale=volume)
-        audio = requests.post(
-            "http://127.0.0.1:10101/synthesis",
-            params={"speaker": speaker}, json=query
-        )
-        tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".wav")
-        tmp.write(audio.content)
-        return tmp.name
+        wav = aivis_backend.call(_synthesize_once, text, speaker, speed, volume,
+                                 deadline=aivis_deadline(text))
     except Exception as e:
         print("⚠️ 音声合成エラー:", e)
-        return None
+        last_voice_degraded = True
+        return canned_voice("voice_down", speaker)
+
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as tmp:
+        tmp.write(wav)
+    return tmp.name
 
 def play_voice(path: str):
     """WAV を再生（F2 でスキップ可）"""
+    import keyboard
+    import sounddevice as sd
+    import soundfile as sf
     if not path or not os.path.exists(path):
         print("⚠️ 再生ファイルなし")
         return
     stop_playback = False
+    finished = threading.Event()   # 再生が終わったら監視スレッドも畳む
     def monitor():
         nonlocal stop_playback
-        while is_running:
+        while is_running and not finished.is_set():
             if keyboard.is_pressed("F2"):
                 stop_playback = True
                 break
-            time.sleep(0.1)
-    threading.Thread(target=monitor, daemon=True).start()
-    data, fs = sf.read(path)
-    sd.play(data, fs)
-    while sd.get_stream().active:
-        if stop_playback or not is_running:
-            print("🔁 再生中止")
-            sd.stop()
-            break
-        time.sleep(0.1)
-    sd.wait()
+            finished.wait(0.1)
+    watcher = threading.Thread(target=monitor, daemon=True)
+    watcher.start()
     try:
-        os.remove(path)
-    except Exception:
-        pass
+        data, fs = sf.read(path)
+        sd.play(data, fs)
+        while sd.get_stream().active:
+            if stop_playback or not is_running:
+                print("🔁 再生中止")
+                sd.stop()
+                break
+            time.sleep(0.1)
+        sd.wait()
+    finally:
+        finished.set()
+        watcher.join()
+        try:
+            os.remove(path)
+        except Exception:
+            pass
 
 # ---------------------------------------------------------------------
 # 🌐 Flask 受信エンドポイント
 # ---------------------------------------------------------------------
-@app.route("/browser-data", methods=["POST"])
-def browser_data_endpoint():
-    global browser_data
-    browser_data = request.json or {}
-    print("📂 受信ブラウザデータ:", browser_data)
-    return "OK", 200
+register_routes(app, browser_ingest, verbose=True)
 
 def run_flask_server():
     app.run(port=5000, debug=False, use_reloader=False)
 
-threading.Thread(target=run_flask_server, daemon=True).start()
+# ---------------------------------------------------------------------
+# 🚀 ローカル（1 人用）起動
+# ---------------------------------------------------------------------
+_local_services_lock = threading.Lock()
+
+def start_local_services():
+    """
+    手元の PC で使うときだけ要るものを起動する（何度呼んでも 1 回だけ）
+    会話ログ＋履歴復元・定型音声キャッシュ・ブラウザ受信の Flask
+    """
+    global conversation_store
+    with _local_services_lock:
+        if conversation_store is not None:
+            return
+        conversation_store = ConversationStore(
+            CONVERSATION_DB,
+            retention_days=CONVERSATION_RETENTION_DAYS,
+            max_turns=CONVERSATION_MAX_TURNS,
+        )
+    threading.Thread(target=restore_history, daemon=True).start()
+    threading.Thread(target=warm_canned_voices, daemon=True).start()
+    threading.Thread(target=run_flask_server, daemon=True).start()
+
+BROWSER_UNSUPPORTED_REPLY = "ごめんね、サーバーモードではブラウザのページ要約は使えないんだ。"
 
 def handle_browser_command():
     """最新ブラウザページを要約（Gemini-Flash 仕様準拠版）"""
-    if not browser_data:
+    tab = browser_ingest.latest()
+    if tab is None:
         return "🌐 ブラウザの情報がまだ受信されていないよ。"
 
-    url   = browser_data.get("url")
-    title = browser_data.get("title", "タイトルなし")
+    url   = tab.url
+    title = tab.title or "タイトルなし"
 
     try:
-        html  = requests.get(url, timeout=10).text
-        soup  = BeautifulSoup(html, "html.parser")
-        text  = soup.get_text()[:3000]        # 3000 文字に切り詰め
+        if tab.text:
+            text = tab.text[:3000]            # 拡張が抽出済みの本文を使う
+        else:
+            # 旧版の拡張（URL とタイトルだけ）向けのフォールバック
+            html  = requests.get(url, timeout=10).text
+            soup  = BeautifulSoup(html, "html.parser")
+            text  = soup.get_text()[:3000]    # 3000 文字に切り詰め
 
         # ── Gemini 形式メッセージ ──
         first_user = (
@@ -415,7 +656,7 @@ def handle_browser_command():
             {"role": "user",  "parts": [first_user]}
         ]
 
-        response = GEMINI_MODEL.generate_content(chat)
+        response = generate_with_deadline(chat)
         summary = response.text.strip()
 
         # 除去したいフレーズのリスト
@@ -430,6 +671,9 @@ def handle_browser_command():
       
         return summary
 
+    except BackendUnavailable as e:
+        print("⚠️ Gemini 縮退モード:", e)
+        return CANNED_PHRASES["gemini_down"]
     except Exception as e:
         return f"要約生成中にエラーが発生: {e}"
 
@@ -438,35 +682,51 @@ def handle_browser_command():
 # ---------------------------------------------------------------------
 # 🎛️ 音声入力→応答 主処理
 # ---------------------------------------------------------------------
-def process_audio_and_generate_reply(audio_path):
-    user_text = transcribe_audio(audio_path)
-    print(f"👤 ユーザー: {user_text}")
-
+def route_reply(user_text: str, history=None, memory_file: Path = MEMORY_FILE,
+                store=None, system_prompt: str = SYSTEM_PROMPT) -> tuple[str, str]:
+    """文字起こし結果を振り分けて (経路, 応答テキスト) を返す"""
     # ① 記憶系
-    if mem := handle_memory_command(user_text):
+    if mem := handle_memory_command(user_text, memory_file):
         print("🧠", mem)
-        return synthesize_voice(mem)
+        return "memory", mem
 
     # ② 検索系
     if result := handle_search_command(user_text):
         print("🔍", result)
-        return synthesize_voice(result)
+        return "search", result
 
     # ③ ブラウザ要約
     if "ページの情報を教えて" in user_text:
+        if history is not None:
+            # サーバーモードのセッション：拡張が送ってくるのはこの PC のタブなので他端末には出さない
+            return "browser", BROWSER_UNSUPPORTED_REPLY
         summary = handle_browser_command()
         print("🌐", summary)
-        return synthesize_voice(summary)
+        return "browser", summary
 
     # ④ 通常対話
-    reply = get_gpt_reply(user_text)
+    reply = get_gpt_reply(user_text, history, memory_file, store, system_prompt)
     print("🤖アシスタント", reply)
+    return "chat", reply
+
+def process_audio_and_generate_reply(audio_path):
+    try:
+        user_text = transcribe_audio(audio_path)
+    finally:
+        # 録音 WAV は文字起こししたら用済み
+        try:
+            os.remove(audio_path)
+        except OSError:
+            pass
+    print(f"👤 ユーザー: {user_text}")
+    _, reply = route_reply(user_text)
     return synthesize_voice(reply)
 
 # ---------------------------------------------------------------------
 # ⌨️ キー監視 / ループ
 # ---------------------------------------------------------------------
 def monitor_keys():
+    import keyboard
     global is_running
     while is_running:
         if keyboard.is_pressed("esc"):
@@ -475,9 +735,12 @@ def monitor_keys():
         time.sleep(0.1)
 
 def main():
+    import keyboard
     global is_running
+    start_local_services()
     print("🔁 F2 で録音開始 / 終了 | ESC でアプリ終了")
     threading.Thread(target=monitor_keys, daemon=True).start()
+    threading.Thread(target=get_tiered_recognizer, daemon=True).start()   # 最初の F2 までに温める
     recording = False
     while is_running:
         if keyboard.is_pressed("F2"):
@@ -499,6 +762,15 @@ def main():
                 finally:
                     recording = False
         time.sleep(0.1)
+    print_asr_summary()
+
+def print_asr_summary():
+    """2 段認識の集計（どちらの段で答えたか・短縮できた秒）を表示"""
+    if _tiered_recognizer is None or not _tiered_recognizer.turns:
+        return
+    s = _tiered_recognizer.summary()
+    print(f"📊 音声認識 {s['turns']} 回：小モデル {s['fast']} / medium {s['full']}"
+          f"（合計 約 {s['saved_sec_total']:.1f} 秒短縮）")
 
 if __name__ == "__main__":
     main()
@@ -1,5 +1,6 @@
 import tkinter as tk
 import time, threading, sounddevice as sd, numpy as np, os
+from functools import lru_cache
 from pathlib import Path
 from dotenv import load_dotenv
 from PIL import Image, ImageTk
@@ -46,6 +47,7 @@ center_x, center_y = WIDTH // 2, HEIGHT // 2 - 40
 ASSET_DIR = Path(__file__).parent / "assets"
 disc_src  = Image.open(ASSET_DIR / "stop.png").convert("RGBA")
 
+@lru_cache(maxsize=128)           # 20ms ごとに PhotoImage を作り直さないようサイズ別に使い回す
 def make_disc(diam):
     return ImageTk.PhotoImage(disc_src.resize((diam, diam), Image.LANCZOS))
 
@@ -89,6 +91,8 @@ def start_recording():
 def reset_after_playback():
     global is_recording
     is_recording = False
+    if status_var.get().startswith("💬"):
+        return                          # 縮退時の文字応答は消さずに残す
     status_var.set("✅ 再生完了 / 待機中")
 
 def monitor_mic_level():
@@ -139,8 +143,10 @@ def animate():
     radius = max(1, min(int(IDLE_RADIUS * scale), max_r))
     diam   = radius * 2
 
-    disc_photo = make_disc(diam)
-    canvas.itemconfig(disc_item, image=disc_photo)
+    photo = make_disc(diam)
+    if photo is not disc_photo:           # サイズが変わったときだけ差し替え
+        disc_photo = photo
+        canvas.itemconfig(disc_item, image=disc_photo)
     canvas.coords(disc_item, center_x, center_y)
 
     root.after(20, animate)
@@ -0,0 +1,157 @@
+"""
+ingest_loadtest.py
+------------------
+browser_ingest のロードテスト。
+数千件のタブイベント（連打・再訪・同一ページ再送を混ぜたもの）を再生し、
+スループット・レイテンシと取り込み統計を表示する。
+
+    python ingest_loadtest.py                    # プロセス内で再生（時計を早送り）
+    python ingest_loadtest.py --gzip             # gzip ペイロード経由
+    python ingest_loadtest.py --url http://127.0.0.1:5000/browser-data
+                                                 # 起動中サーバーに HTTP で送る
+"""
+
+import argparse
+import gzip
+import json
+import random
+import statistics
+import time
+
+from browser_ingest import BrowserIngest, decode_payload
+
+
+class FakeClock:
+    """ロードテスト用の早送り時計"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, sec: float) -> None:
+        self.now += sec
+
+
+def make_pages(n_pages: int, text_chars: int, rng: random.Random) -> list[dict]:
+    words = ["ニュース", "天気", "アプリ", "クーポン", "プッシュ", "ゲーム", "東京", "開発"]
+    pages = []
+    for i in range(n_pages):
+        body = "".join(rng.choice(words) for _ in range(text_chars // 3))[:text_chars]
+        pages.append({"url": f"https://example.com/page/{i}", "title": f"ページ {i}", "text": body})
+    return pages
+
+
+def make_events(n_events: int, pages: list[dict], rng: random.Random):
+    """
+    (待ち秒, payload) の列を生成
+    ・30% は 50ms 間隔の連打（デバウンス対象）
+    ・20% は同じページの再送（重複対象）
+    ・5% は同じ URL で本文が更新されたもの
+    """
+    current = rng.choice(pages)
+    for _ in range(n_events):
+        r = rng.random()
+        if r < 0.30:
+            gap, current = 0.05, rng.choice(pages)
+        elif r < 0.50:
+            gap = 2.0
+        elif r < 0.55:
+            gap = 2.0
+            current = dict(current, text=current["text"] + f" 更新{rng.random():.6f}")
+        else:
+            gap, current = rng.uniform(1.0, 10.0), rng.choice(pages)
+        yield gap, current
+
+
+def encode(payload: dict, use_gzip: bool) -> tuple[bytes, str]:
+    raw = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    if use_gzip:
+        return gzip.compress(raw), "gzip"
+    return raw, ""
+
+
+def run_local(args, events) -> tuple[list[float], BrowserIngest]:
+    clock = FakeClock()
+    ingest = BrowserIngest(debounce_sec=args.debounce, ring_size=args.ring, clock=clock)
+    latencies = []
+    for gap, payload in events:
+        clock.advance(gap)
+        body, enc = encode(payload, args.gzip)
+        t0 = time.perf_counter()
+        ingest.ingest(decode_payload(body, enc), nbytes=len(body))
+        latencies.append(time.perf_counter() - t0)
+    clock.advance(args.debounce)
+    ingest.latest()        # 最後の保留分を確定
+    return latencies, ingest
+
+
+def run_http(args, events) -> list[float]:
+    import requests
+
+    session = requests.Session()
+    latencies = []
+    for _, payload in events:
+        body, enc = encode(payload, args.gzip)
+        headers = {"Content-Type": "application/json"}
+        if enc:
+            headers["Content-Encoding"] = enc
+        t0 = time.perf_counter()
+        session.post(args.url, data=body, headers=headers, timeout=10).raise_for_status()
+        latencies.append(time.perf_counter() - t0)
+    return latencies
+
+
+def percentile(values: list[float], p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="browser_ingest ロードテスト")
+    parser.add_argument("--events", type=int, default=5000)
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--text-chars", type=int, default=3000)
+    parser.add_argument("--debounce", type=float, default=0.5)
+    parser.add_argument("--ring", type=int, default=20)
+    parser.add_argument("--gzip", action="store_true", help="gzip 圧縮ペイロードで送る")
+    parser.add_argument("--url", help="指定すると起動中サーバーへ HTTP で送る")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    pages = make_pages(args.pages, args.text_chars, rng)
+    events = list(make_events(args.events, pages, rng))
+
+    t0 = time.perf_counter()
+    if args.url:
+        latencies, ingest = run_http(args, events), None
+    else:
+        latencies, ingest = run_local(args, events)
+    elapsed = time.perf_counter() - t0
+
+    print(f"📊 {len(events)} イベント / {elapsed:.2f} 秒 ({len(events) / elapsed:,.0f} events/s)")
+    print(
+        f"⏱️ latency  mean {statistics.mean(latencies) * 1e3:.3f}ms"
+        f"  p50 {percentile(latencies, 0.50) * 1e3:.3f}ms"
+        f"  p95 {percentile(latencies, 0.95) * 1e3:.3f}ms"
+        f"  p99 {percentile(latencies, 0.99) * 1e3:.3f}ms"
+    )
+    if ingest is None:
+        return
+
+    stats = ingest.stats
+    print("🧮", json.dumps(stats.as_dict(), ensure_ascii=False))
+    print(f"📦 リングバッファ {len(ingest)}/{args.ring}")
+
+    # 取り込み結果の整合性チェック
+    assert len(ingest) <= args.ring, "リングバッファが上限を超えた"
+    assert stats.received == len(events)
+    assert stats.committed + stats.debounced + stats.duplicates == stats.received, "件数が合わない"
+    assert ingest.latest().url == events[-1][1]["url"], "最新タブが最後のイベントと一致しない"
+    print("✅ OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""
+resilience.py
+-------------
+Gemini / AIVISpeech 呼び出しの “遅延対策” モジュール。
+
+・1 回ごとのデッドライン（超えたら DeadlineExceeded）
+・p95 レイテンシを過ぎても返ってこなければ 2 本目を投げるヘッジ
+・連続失敗でサーキットを開き、しばらくは即 CircuitOpen で失敗
+  → 呼び出し側は待たずに縮退モード（文字だけ表示／定型音声）へ
+
+    gemini_backend = ResilientBackend("gemini", deadline=20.0)
+    reply = gemini_backend.call(GEMINI_MODEL.generate_content, chat)
+
+Python のスレッドは途中で止められないため、デッドラインを過ぎた呼び出しは
+結果を捨てるだけ。下の層にも timeout を渡して後始末が必ず終わるようにする。
+"""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+class BackendUnavailable(Exception):
+    """バックエンドが使えない（呼び出し側は縮退モードへ）"""
+
+
+class DeadlineExceeded(BackendUnavailable):
+    """デッドラインまでに応答がなかった"""
+
+
+class CircuitOpen(BackendUnavailable):
+    """サーキットが開いているので呼ばずに失敗した"""
+
+
+class LatencyTracker:
+    """直近 window 件の成功レイテンシから分位点を出す"""
+
+    def __init__(self, window: int = 100):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, sec: float) -> None:
+        with self._lock:
+            self._samples.append(sec)
+
+    def percentile(self, p: float) -> float | None:
+        with self._lock:
+            if not self._samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+
+class CircuitBreaker:
+    """
+    closed → (連続 failure_threshold 回失敗) → open
+    open   → (reset_timeout 秒経過) → half_open（1 本だけ試す）
+    half_open で成功すれば closed、失敗すれば再び open。
+    """
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 30.0,
+                 clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state()
+
+    def _state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if self._clock() - self._opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        """呼んでよいか（half_open では同時に 1 本だけ許可）"""
+        with self._lock:
+            state = self._state()
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                self._opened_at = self._clock()
+
+
+class ResilientBackend:
+    """
+    🛡️ デッドライン＋ヘッジ＋サーキットブレーカー付きの呼び出し口
+    --------------------------------------------------------------
+    name           : ログ用の名前
+    deadline       : 1 回の call 全体の上限秒
+    hedge          : True なら p95 を過ぎた時点で 2 本目を投げる
+    hedge_min_samples : p95 を信用するのに必要なサンプル数（未満ならヘッジしない）
+    """
+
+    def __init__(self, name: str, deadline: float, hedge: bool = True,
+                 hedge_min_samples: int = 20, breaker: CircuitBreaker | None = None,
+                 max_workers: int = 4):
+        self.name = name
+        self.deadline = deadline
+        self.hedge = hedge
+        self.hedge_min_samples = hedge_min_samples
+        self.breaker = breaker or CircuitBreaker()
+        self.latency = LatencyTracker()
+        self.hedges_sent = 0
+        self.queue_timeouts = 0            # プールの空き待ちで打ち切った回数
+        self.max_workers = max_workers
+        self._running = 0
+        self._running_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix=f"resilient-{name}")
+
+    def set_max_workers(self, max_workers: int) -> None:
+        """プールの大きさを変える（サーバーモードでは同時ターン数に合わせる）"""
+        old = self._executor
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix=f"resilient-{self.name}")
+        old.shutdown(wait=False)
+
+    def hedge_delay(self) -> float | None:
+        """2 本目を投げるまでの待ち秒（まだ分からなければ None）"""
+        if not self.hedge or len(self.latency) < self.hedge_min_samples:
+            return None
+        return self.latency.percentile(0.95)
+
+    def _attempt(self, started: threading.Event, start_box: list, fn, args, kwargs):
+        """プールのスレッドで実際に走り出した時刻を記録してから fn を呼ぶ"""
+        with self._running_lock:
+            self._running += 1
+            if not start_box:
+                start_box.append(time.monotonic())
+                started.set()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self._running_lock:
+                self._running -= 1
+
+    def call(self, fn, *args, deadline: float | None = None, **kwargs):
+        """
+        fn(*args, **kwargs) を実行して結果を返す。
+        失敗時は BackendUnavailable（DeadlineExceeded / CircuitOpen）か fn の例外。
+
+        デッドラインは呼び出しがプールで実際に走り出した時点から数える。
+        プールの空き待ちにも同じだけの上限をかけ、超えたら DeadlineExceeded にするが、
+        混雑はバックエンドの遅さではないのでサーキットの失敗には数えない。
+        """
+        if not self.breaker.allow():
+            raise CircuitOpen(f"{self.name} は停止中とみなしています（サーキット open）")
+
+        deadline = self.deadline if deadline is None else deadline
+        started, start_box = threading.Event(), []
+        primary = self._executor.submit(self._attempt, started, start_box, fn, args, kwargs)
+        if not started.wait(timeout=deadline) and primary.cancel():
+            self.queue_timeouts += 1
+            raise DeadlineExceeded(f"{self.name} のプールが {deadline:.1f} 秒空きませんでした")
+        start = start_box[0]
+        end = start + deadline
+        futures = {primary}
+
+        delay = self.hedge_delay()
+        if delay is not None and delay < deadline:
+            done, _ = wait(futures, timeout=max(0.0, start + delay - time.monotonic()))
+            # 空きスレッドがないときに積むと、後ろのターンの待ちを増やすだけなので投げない
+            if not done and self._running < self.max_workers:
+                futures.add(self._executor.submit(
+                    self._attempt, started, start_box, fn, args, kwargs))
+                self.hedges_sent += 1
+
+        last_error = None
+        while futures:
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                break
+            done, futures = wait(futures, timeout=remaining, return_when=FIRST_COMPLETED)
+            for fut in done:
+                if fut.exception() is None:
+                    self.latency.record(time.monotonic() - start)
+                    self.breaker.record_success()
+                    return fut.result()
+                last_error = fut.exception()
+
+        for fut in futures:
+            fut.cancel()                      # まだ走っていないヘッジは捨てる
+        self.breaker.record_failure()
+        if last_error is not None and not futures:
+            raise last_error
+        raise DeadlineExceeded(f"{self.name} が {deadline:.1f} 秒以内に応答しませんでした")
@@ -0,0 +1,156 @@
+"""
+server_loadgen.py
+-----------------
+assistant_server.py のロードジェネレータ。
+セッション数を段階的に増やしながら同時にターンを流し、
+スループットとレイテンシ、Whisper のバッチ状況を表示する。
+
+    python server_loadgen.py --wav sample.wav --sessions 1,2,4,8 --turns 5
+    python server_loadgen.py --text "明日の天気は？" --sessions 1,4,16
+
+--wav を渡すと音声ターン（ASR バッチを含む）、--text なら文字ターン。
+失敗は 3 種類に分けて数える：
+    err      … サーバーが error を返した／接続が切れた
+    timeout  … --timeout 秒以内に応答が揃わなかった（そのセッションはそこで打ち切り）
+    degraded … Gemini のデッドライン切れ・サーキット open で定型文が返った
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+from pathlib import Path
+
+import websockets
+
+
+async def _turn(ws, payload) -> dict:
+    await ws.send(payload)
+    reply = json.loads(await ws.recv())
+    if reply.get("type") == "error":
+        return {"error": reply.get("error")}
+    await ws.recv()                   # 合成 WAV（または audio_unavailable）
+    return {
+        "route": reply.get("route"),
+        "degraded": reply.get("degraded", False),
+        **{f"server_{k}": v for k, v in reply.get("timing", {}).items()},
+    }
+
+
+async def run_session(url: str, session_id: str, turns: int, payload,
+                      timeout: float, token: str | None = None) -> list[dict]:
+    """1 セッション分：接続して turns 回ターンを流し、各ターンの計測値を返す"""
+    results = []
+    try:
+        async with websockets.connect(url, max_size=None) as ws:
+            await ws.send(json.dumps({"type": "hello", "session": session_id, "token": token}))
+            json.loads(await ws.recv())   # ready
+            for _ in range(turns):
+                t0 = time.perf_counter()
+                try:
+                    result = await asyncio.wait_for(_turn(ws, payload), timeout)
+                except asyncio.TimeoutError:
+                    # 応答が後から届くと次のターンとずれるので、このセッションは打ち切る
+                    results.append({"timeout": True, "latency": time.perf_counter() - t0})
+                    break
+                results.append({**result, "latency": time.perf_counter() - t0})
+    except (OSError, websockets.exceptions.WebSocketException) as e:
+        results.append({"error": f"接続エラー: {e}", "latency": 0.0})
+    return results
+
+
+async def fetch_stats(url: str, token: str | None = None) -> dict:
+    async with websockets.connect(url) as ws:
+        await ws.send(json.dumps({"type": "hello", "session": "loadgen-stats", "token": token}))
+        await ws.recv()
+        await ws.send(json.dumps({"type": "stats"}))
+        return json.loads(await ws.recv())
+
+
+def _pct(values: list[float], p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+def _diff_whisper(before: dict, after: dict) -> tuple[int, int]:
+    w0, w1 = before.get("whisper", {}), after.get("whisper", {})
+    return w1.get("batches", 0) - w0.get("batches", 0), w1.get("items", 0) - w0.get("items", 0)
+
+
+async def run_level(args, n_sessions: int, payload) -> dict:
+    before = await fetch_stats(args.url, args.token)
+    t0 = time.perf_counter()
+    per_session = await asyncio.gather(*(
+        # 段階をまたいで同じ ID を使い回す（段ごとに新しいセッションを作り続けない）
+        run_session(args.url, f"load-{i}", args.turns, payload, args.timeout, args.token)
+        for i in range(n_sessions)
+    ))
+    wall = time.perf_counter() - t0
+    after = await fetch_stats(args.url, args.token)
+
+    results = [r for rs in per_session for r in rs]
+    ok = [r for r in results if "error" not in r and "timeout" not in r]
+    served = [r for r in ok if not r.get("degraded")]   # 定型文は速いだけなので除く
+    latencies = [r["latency"] for r in served] or [0.0]
+    asr = [r["server_asr"] for r in ok if "server_asr" in r]
+    batches, items = _diff_whisper(before, after)
+    return {
+        "sessions": n_sessions,
+        "turns": len(results),
+        "errors": sum("error" in r for r in results),
+        "timeouts": sum("timeout" in r for r in results),
+        "degraded": sum(r.get("degraded", False) for r in ok),
+        "throughput": len(served) / wall if wall else 0.0,
+        "p50": _pct(latencies, 0.50),
+        "p95": _pct(latencies, 0.95),
+        "asr_mean": statistics.mean(asr) if asr else None,
+        "batch_mean": items / batches if batches else None,
+    }
+
+
+def print_table(rows: list[dict]) -> None:
+    print(f"{'sessions':>8} {'turns':>6} {'err':>4} {'tmo':>4} {'degr':>4} {'turns/s':>8} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'asr ms':>8} {'batch':>6}")
+    for r in rows:
+        asr = f"{r['asr_mean'] * 1e3:8.0f}" if r["asr_mean"] is not None else f"{'-':>8}"
+        batch = f"{r['batch_mean']:6.2f}" if r["batch_mean"] is not None else f"{'-':>6}"
+        print(f"{r['sessions']:>8} {r['turns']:>6} {r['errors']:>4} {r['timeouts']:>4} "
+              f"{r['degraded']:>4} {r['throughput']:8.2f} "
+              f"{r['p50'] * 1e3:8.0f} {r['p95'] * 1e3:8.0f} {asr} {batch}")
+
+
+async def main_async(args) -> None:
+    if args.wav:
+        payload = Path(args.wav).read_bytes()
+    else:
+        payload = json.dumps({"type": "text", "text": args.text}, ensure_ascii=False)
+
+    rows = []
+    for n in (int(x) for x in args.sessions.split(",")):
+        print(f"🚀 {n} セッション × {args.turns} ターン ...")
+        rows.append(await run_level(args, n, payload))
+    print_table(rows)
+    if args.json:
+        Path(args.json).write_text(json.dumps(rows, indent=2, ensure_ascii=False), encoding="utf-8")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="assistant_server ロードジェネレータ")
+    parser.add_argument("--url", default="ws://127.0.0.1:8765")
+    parser.add_argument("--token", default=os.getenv("ASSISTANT_SERVER_TOKEN"),
+                        help="サーバーの共有シークレット")
+    src = parser.add_mutually_exclusive_group(required=True)
+    src.add_argument("--wav", help="送る発話 WAV（音声ターン）")
+    src.add_argument("--text", help="送る文字列（文字ターン）")
+    parser.add_argument("--sessions", default="1,2,4,8", help="同時セッション数（カンマ区切り）")
+    parser.add_argument("--turns", type=int, default=5, help="1 セッションあたりのターン数")
+    parser.add_argument("--timeout", type=float, default=60.0,
+                        help="1 ターンの応答を待つ最大秒（超えたら timeout として数える）")
+    parser.add_argument("--json", help="結果を JSON で保存するパス")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
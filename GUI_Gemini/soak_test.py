@@ -0,0 +1,423 @@
+"""
+soak_test.py
+------------
+終日稼働を想定したリソースリークの耐久テスト（ヘッドレス）。
+
+gemini.py の 1 ターン（smart_record → process_audio_and_generate_reply → play_voice）を
+ローカルの代役（フェイク AIVISpeech / Gemini サーバー、フェイク Whisper・マイク・スピーカー）
+相手に数千回まわし、一定間隔で
+
+    ・RSS            ・スレッド数        ・開いているファイル記述子
+    ・一時ディレクトリの使用量（件数・MB）  ・tracemalloc の確保量と増加上位
+
+を記録する。確保元の増加上位（--top 件）はサンプルごとにウォームアップ時点との差で残す。
+ウォームアップ後からの増加量が予算を超えたら終了コード 1。
+結果は JSON レポートに保存でき、--compare で前リリースのレポートと比べられる。
+作業ディレクトリ（会話ログ DB・定型 WAV・記憶 JSON）は終了時に消す（--keep で残す）。
+
+    python soak_test.py --turns 5000 --report soak_1.2.json
+    python soak_test.py --turns 5000 --report soak_1.3.json --compare soak_1.2.json
+
+※ 依存ライブラリ（faster-whisper / sounddevice など）はインストール済みである前提。
+  GPU・マイク・AIVISpeech・Gemini API は使わない。psutil があれば RSS / FD をそちらで測る。
+"""
+
+import argparse
+import contextlib
+import hashlib
+import itertools
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+
+import numpy as np
+
+from fake_backends import FakeServer, Faults
+
+try:
+    import psutil
+except ImportError:       # 無ければ /proc から読む（Linux のみ）
+    psutil = None
+
+# 代役 Whisper が順番に返す発話（ネットワークに出る検索系は避ける）
+UTTERANCES = [
+    "覚えて好きな色は青",
+    "好きな色って覚えてる？",
+    "こんにちは、今日もよろしくね",
+    "前にカレーについて話した？",
+    "これは忘れて好きな色",
+    "おすすめの本を教えて",
+]
+
+
+@dataclass
+class Budgets:
+    """ウォームアップ後に許す増加量"""
+    rss_mb: float = 64.0
+    threads: int = 4
+    fds: int = 16
+    tmp_files: int = 8
+    tmp_mb: float = 16.0
+    traced_mb: float = 32.0
+
+
+# ---------------------------------------------------------------------
+# 🎭 代役（マイク・スピーカー・Whisper・Gemini）
+# ---------------------------------------------------------------------
+class FakeWhisperModel:
+    """
+    transcribe() が UTTERANCES を順番に返す。
+    同じ音声には同じ文を返すので、1 ターン内の小モデル／medium の結果が揃い、
+    振り分けが毎回同じになる（無音＝小モデルの温め用は空文字）。
+    """
+    _cycle = itertools.cycle(UTTERANCES)
+    _lock = threading.Lock()
+    _last = (None, "")                   # (音声のダイジェスト, 返した文)
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def transcribe(self, audio, **kwargs):
+        if isinstance(audio, str):       # 実物と同じくパスなら WAV を読む
+            with open(audio, "rb") as f:
+                data = f.read()
+        else:
+            if not np.any(audio):
+                return iter([]), None
+            data = np.ascontiguousarray(audio).tobytes()
+        key = hashlib.blake2b(data, digest_size=16).digest()
+        with self._lock:
+            if FakeWhisperModel._last[0] != key:
+                FakeWhisperModel._last = (key, next(self._cycle))
+            text = FakeWhisperModel._last[1]
+        segment = SimpleNamespace(text=text, avg_logprob=-0.1, no_speech_prob=0.0)
+        return iter([segment]), None
+
+
+class FakeGeminiModel:
+    """フェイクサーバーの /generate に HTTP で問い合わせる"""
+
+    def __init__(self, name, url: str):
+        self.url = url
+
+    def generate_content(self, contents, request_options=None):
+        import requests
+        timeout = (request_options or {}).get("timeout", 10)
+        res = requests.post(f"{self.url}/generate", json={"n": len(contents)}, timeout=timeout)
+        res.raise_for_status()
+        return SimpleNamespace(text=res.json()["text"])
+
+
+class FakeInputStream:
+    """
+    sd.InputStream の代役。
+    別スレッドで「発話（大きい音）→ 無音」のブロックを callback に流す。
+    """
+    current = None
+
+    def __init__(self, callback, samplerate, channels, blocksize=1024):
+        self.callback = callback
+        self.blocksize = blocksize
+        self.stopped = threading.Event()
+        self._thread = threading.Thread(target=self._feed, daemon=True)
+
+    def _feed(self):
+        import sounddevice as sd
+        rng = np.random.default_rng()
+        try:
+            for i in range(200):
+                amp = 0.5 if i < 8 else 0.0
+                block = (rng.standard_normal((self.blocksize, 1)) * amp).astype(np.float32)
+                self.callback(block, self.blocksize, None, None)
+                time.sleep(0.001)
+        except sd.CallbackStop:
+            pass
+        finally:
+            self.stopped.set()
+
+    def __enter__(self):
+        FakeInputStream.current = self
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopped.set()
+        self._thread.join()
+        FakeInputStream.current = None
+
+
+def fake_sleep(ms):
+    """sd.sleep の代役：録音が止まるか ms 経つまで待つ"""
+    stream = FakeInputStream.current
+    if stream is not None:
+        stream.stopped.wait(ms / 1000)
+
+
+@contextlib.contextmanager
+def standins(fake_url: str):
+    """gemini を import する前に外部 I/O を代役に差し替える"""
+    with contextlib.ExitStack() as stack:
+        patches = {
+            "faster_whisper.WhisperModel": FakeWhisperModel,
+            "google.generativeai.GenerativeModel": lambda name: FakeGeminiModel(name, fake_url),
+            "google.generativeai.configure": lambda **kw: None,
+            "sounddevice.InputStream": FakeInputStream,
+            "sounddevice.sleep": fake_sleep,
+            "sounddevice.play": lambda data, fs: None,
+            "sounddevice.stop": lambda: None,
+            "sounddevice.wait": lambda: None,
+            "sounddevice.get_stream": lambda: SimpleNamespace(active=False),
+            "keyboard.is_pressed": lambda key: False,
+            "flask.Flask.run": lambda self, *a, **kw: None,     # ブラウザ受信サーバーは立てない
+        }
+        for target, replacement in patches.items():
+            stack.enter_context(mock.patch(target, replacement))
+        yield
+
+
+# ---------------------------------------------------------------------
+# 📏 計測
+# ---------------------------------------------------------------------
+def _rss_mb() -> float | None:
+    if psutil:
+        return psutil.Process().memory_info().rss / 2**20
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _open_fds() -> int | None:
+    if psutil:
+        proc = psutil.Process()
+        return proc.num_handles() if os.name == "nt" else proc.num_fds()
+    try:
+        return len(os.listdir("/proc/self/fd"))
+    except OSError:
+        return None
+
+
+def _dir_usage(path: Path) -> tuple[int, float]:
+    files, size = 0, 0
+    for p in path.rglob("*"):
+        try:
+            if p.is_file():
+                files += 1
+                size += p.stat().st_size
+        except OSError:
+            pass          # 計測中に消えたファイル
+    return files, size / 2**20
+
+
+def sample(turn: int, tmp_dir: Path) -> dict:
+    tmp_files, tmp_mb = _dir_usage(tmp_dir)
+    traced = tracemalloc.get_traced_memory()[0] / 2**20 if tracemalloc.is_tracing() else 0.0
+    return {
+        "turn": turn,
+        "t": time.monotonic(),
+        "rss_mb": _rss_mb(),
+        "threads": threading.active_count(),
+        "fds": _open_fds(),
+        "tmp_files": tmp_files,
+        "tmp_mb": tmp_mb,
+        "traced_mb": traced,
+    }
+
+
+def top_allocators(before: tracemalloc.Snapshot, after: tracemalloc.Snapshot, limit: int = 10):
+    stats = after.compare_to(before, "lineno")
+    return [
+        {"where": str(s.traceback[0]), "size_diff_kb": s.size_diff / 1024, "count_diff": s.count_diff}
+        for s in stats[:limit]
+    ]
+
+
+def growth_of(baseline: dict, final: dict) -> dict:
+    return {
+        k: (final[k] - baseline[k]) if final[k] is not None and baseline[k] is not None else None
+        for k in asdict(Budgets())
+    }
+
+
+def check_budgets(growth: dict, budgets: Budgets) -> list[str]:
+    return [
+        f"{k}: +{growth[k]:.2f}（予算 {limit}）"
+        for k, limit in asdict(budgets).items()
+        if growth[k] is not None and growth[k] > limit
+    ]
+
+
+# ---------------------------------------------------------------------
+# 🏃 実行
+# ---------------------------------------------------------------------
+def run(args) -> dict:
+    workdir = Path(tempfile.mkdtemp(prefix="desktopai_soak_"))
+    tmp_dir = workdir / "tmp"
+    tmp_dir.mkdir()
+    cwd = os.getcwd()
+    tempfile.tempdir = str(tmp_dir)          # 一時ファイルの増減をここだけで数える
+    os.chdir(workdir)                        # 記憶 JSON や会話ログも作業ディレクトリへ
+    try:
+        return _run(args, workdir, tmp_dir)
+    finally:
+        os.chdir(cwd)
+        tempfile.tempdir = None
+        if args.keep:
+            print(f"📁 作業ディレクトリを残しました: {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _run(args, workdir: Path, tmp_dir: Path) -> dict:
+    with FakeServer(faults=Faults(base_latency=args.latency, error_rate=args.error_rate)) as srv:
+        os.environ.update(
+            AIVIS_URL=srv.url,
+            CONVERSATION_DB=str(workdir / "conversation_log.db"),
+            CANNED_VOICE_DIR=str(workdir / "canned"),   # 本物の定型音声キャッシュを無音で上書きしない
+            GEMINI_DEADLINE_SEC="2",
+            AIVIS_DEADLINE_SEC="2",
+        )
+        with standins(srv.url):
+            import gemini
+            gemini.start_local_services()    # 手元モードと同じ構成で回す
+            gemini.SILENCE_DURATION = 0.0    # 無音判定を待たない
+
+            failures, samples = 0, []
+            baseline = snap0 = None
+            t_start = time.monotonic()
+            for turn in range(1, args.turns + 1):
+                try:
+                    wav = gemini.smart_record(max_duration=2)
+                    voice = gemini.process_audio_and_generate_reply(wav) if wav else None
+                    gemini.play_voice(voice)
+                except Exception as e:
+                    failures += 1
+                    if failures <= 5:
+                        print(f"⚠️ ターン {turn} 失敗: {e}")
+
+                if turn == args.warmup:
+                    gemini.conversation_store.flush()
+                    tracemalloc.start(args.trace_depth)
+                    snap0 = tracemalloc.take_snapshot()
+                    baseline = sample(turn, tmp_dir)
+                    samples.append(baseline)
+                elif turn > args.warmup and turn % args.sample_every == 0:
+                    s = sample(turn, tmp_dir)
+                    # 基準からの確保元の増分も都度残す（リリース間で推移を比べられるように）
+                    s["top_allocators"] = top_allocators(snap0, tracemalloc.take_snapshot(), args.top)
+                    samples.append(s)
+                    print(f"📈 {turn:>6} turns  rss {s['rss_mb'] or 0:.1f}MB  threads {s['threads']}"
+                          f"  fds {s['fds']}  tmp {s['tmp_files']} files  traced {s['traced_mb']:.1f}MB")
+
+            gemini.conversation_store.flush()
+            elapsed = time.monotonic() - t_start
+            final = sample(args.turns, tmp_dir)
+            samples.append(final)
+            allocators = top_allocators(snap0, tracemalloc.take_snapshot(), args.top) if snap0 else []
+            final["top_allocators"] = allocators
+            tracemalloc.stop()
+            gemini.conversation_store.close()   # 作業ディレクトリを消す前に DB を閉じる
+            recognizer = gemini.get_tiered_recognizer()
+            asr = recognizer.summary() if recognizer else None
+
+    budgets = Budgets(args.budget_rss_mb, args.budget_threads, args.budget_fds,
+                      args.budget_tmp_files, args.budget_tmp_mb, args.budget_traced_mb)
+    growth = growth_of(baseline or samples[0], final)
+    return {
+        "label": args.label,
+        "config": {k: v for k, v in vars(args).items() if k not in ("report", "compare", "keep")},
+        "turns_per_sec": args.turns / elapsed if elapsed else 0.0,
+        "failed_turns": failures,
+        "budgets": asdict(budgets),
+        "baseline": baseline,
+        "final": final,
+        "growth": growth,
+        "violations": check_budgets(growth, budgets),
+        "top_allocators": allocators,
+        "asr": asr,
+        "samples": samples,
+    }
+
+
+def print_report(report: dict) -> None:
+    print(f"\n🧪 soak: {report['config']['turns']} ターン"
+          f"（{report['turns_per_sec']:.1f} turns/s, 失敗 {report['failed_turns']}）")
+    for k, v in report["growth"].items():
+        limit = report["budgets"][k]
+        mark = "—" if v is None else ("❌" if v > limit else "✅")
+        shown = "n/a" if v is None else f"{v:+.2f}"
+        print(f"  {mark} {k:<10} {shown:>10}  (予算 {limit})")
+    if asr := report.get("asr"):
+        print(f"  🎧 2 段認識  小モデル {asr['fast']} / medium {asr['full']}"
+              f"  短縮 計 {asr['saved_sec_total']:+.2f}s")
+    if report["top_allocators"]:
+        print("  🔍 増加の大きい確保元:")
+        for a in report["top_allocators"][:5]:
+            print(f"     {a['size_diff_kb']:+9.1f}KB  {a['where']}")
+
+
+def print_compare(old: dict, new: dict) -> None:
+    print(f"\n📊 比較: {old.get('label') or '前回'} → {new.get('label') or '今回'}")
+    for k in new["growth"]:
+        a, b = old["growth"].get(k), new["growth"][k]
+        if a is None or b is None:
+            print(f"  {k:<10} n/a")
+        else:
+            print(f"  {k:<10} {a:+10.2f} → {b:+10.2f}  ({b - a:+.2f})")
+    print(f"  {'turns/s':<10} {old['turns_per_sec']:10.1f} → {new['turns_per_sec']:10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Desktop AI Assistant 耐久（リーク）テスト")
+    parser.add_argument("--turns", type=int, default=3000)
+    parser.add_argument("--warmup", type=int, default=100, help="この回数までは計測の基準に含めない")
+    parser.add_argument("--sample-every", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.0, help="フェイクサーバーの応答秒")
+    parser.add_argument("--error-rate", type=float, default=0.05,
+                        help="フェイクサーバーのエラー率（合成失敗の経路も通す）")
+    parser.add_argument("--trace-depth", type=int, default=5, help="tracemalloc のフレーム数")
+    parser.add_argument("--top", type=int, default=10, help="サンプルごとに残す確保元の数")
+    parser.add_argument("--keep", action="store_true", help="作業ディレクトリ（DB・WAV など）を消さずに残す")
+    parser.add_argument("--label", default="", help="レポートに残す名前（リリース番号など）")
+    parser.add_argument("--report", help="JSON レポートの保存先")
+    parser.add_argument("--compare", help="比較する過去の JSON レポート")
+    defaults = Budgets()
+    parser.add_argument("--budget-rss-mb", type=float, default=defaults.rss_mb)
+    parser.add_argument("--budget-threads", type=int, default=defaults.threads)
+    parser.add_argument("--budget-fds", type=int, default=defaults.fds)
+    parser.add_argument("--budget-tmp-files", type=int, default=defaults.tmp_files)
+    parser.add_argument("--budget-tmp-mb", type=float, default=defaults.tmp_mb)
+    parser.add_argument("--budget-traced-mb", type=float, default=defaults.traced_mb)
+    args = parser.parse_args()
+    if args.warmup >= args.turns:
+        parser.error("--warmup は --turns より小さくしてください")
+
+    report_path = Path(args.report).resolve() if args.report else None
+    compare_path = Path(args.compare).resolve() if args.compare else None
+
+    report = run(args)
+    print_report(report)
+    if report_path:
+        report_path.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+        print(f"💾 レポート保存: {report_path}")
+    if compare_path:
+        print_compare(json.loads(compare_path.read_text(encoding="utf-8")), report)
+
+    if report["violations"]:
+        print("❌ 予算超過:", *report["violations"], sep="\n  ")
+        sys.exit(1)
+    print("✅ 予算内")
+
+
+if __name__ == "__main__":
+    main()
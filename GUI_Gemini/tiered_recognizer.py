@@ -0,0 +1,187 @@
+"""
+tiered_recognizer.py
+--------------------
+2 段構えの音声認識モジュール。
+
+・まず小さいモデル（tiny / base、int8、常駐）で文字起こし
+・結果がコマンド（覚えて… / ニュース / 天気 など）に十分な確信度で一致すれば
+  それをそのまま採用 → medium モデルを待たない
+・そうでなければ medium（フル）モデルの結果を使う
+  speculative=True なら最初から両方を並行で走らせ、フル側の待ち時間を隠す
+  （コマンドのターンでも medium を回すことになるので GPU に余裕があるときだけ）
+・ターンごとにどちらの段が答えたか・どれだけ時間を節約したかを記録
+
+    recognizer = TieredRecognizer(whisper_model, fast_model, detect_command_intent)
+    result = recognizer.recognize("voice.wav")
+    result.text, result.tier, result.saved_sec
+"""
+
+import math
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+import numpy as np
+from faster_whisper.audio import decode_audio
+
+WHISPER_SAMPLE_RATE = 16_000
+
+
+@dataclass
+class TierResult:
+    """1 ターン分の認識結果と計測値"""
+    text: str
+    tier: str                    # "fast" / "full"
+    intent: str | None           # 小モデルで判定したコマンド種別
+    confidence: float            # 小モデルの確信度（0〜1）
+    decode_sec: float            # 音声デコード（両段で共有）
+    fast_sec: float
+    full_sec: float | None       # フルモデルを待った場合のみ
+    total_sec: float
+    saved_sec: float             # 「デコード＋フルモデルだけ」と比べて短縮できた秒（負なら損）
+
+
+class TieredRecognizer:
+    """
+    ⚡ 小モデル → フルモデルの段階的認識
+    ----------------------------------
+    full_model     : 既存の medium WhisperModel
+    fast_model     : tiny / base の WhisperModel（int8 推奨）
+    detect_intent  : callable(str) -> str | None（コマンドならその種別）
+    min_confidence : 小モデルの結果を採用する確信度の下限
+    speculative    : True ならフルモデルを最初から並行実行
+    language       : 言語判定を省くため両モデルとも固定
+    """
+
+    def __init__(self, full_model, fast_model, detect_intent, min_confidence: float = 0.6,
+                 speculative: bool = False, language: str = "ja", history: int = 200):
+        self.full_model = full_model
+        self.fast_model = fast_model
+        self.detect_intent = detect_intent
+        self.min_confidence = min_confidence
+        self.speculative = speculative
+        self.language = language
+        self.turns: deque[TierResult] = deque(maxlen=history)
+        self._full_estimate = None            # フルモデル所要秒の移動平均
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="whisper-full")
+        self.warm_up()
+
+    # ----------------------------
+    # 小モデルを温めておく
+    # ----------------------------
+    def warm_up(self) -> None:
+        """初回呼び出しの遅延（CUDA 初期化など）を起動時に済ませる"""
+        self._run_fast(np.zeros(WHISPER_SAMPLE_RATE, dtype=np.float32))
+
+    # ----------------------------
+    # 各段の実行
+    # ----------------------------
+    def _run_fast(self, audio) -> tuple[str, float]:
+        segments, _ = self.fast_model.transcribe(
+            audio, language=self.language, beam_size=1, without_timestamps=True,
+        )
+        segments = list(segments)
+        text = " ".join(s.text.strip() for s in segments)
+        return text, _confidence(segments)
+
+    def _run_full(self, audio, cancelled: threading.Event) -> tuple[str, float, bool]:
+        """(テキスト, 所要秒, 最後まで走ったか) を返す"""
+        t0 = time.perf_counter()
+        segments, _ = self.full_model.transcribe(audio, language=self.language)
+        texts = []
+        for s in segments:                  # 生成は遅延評価なので途中で打ち切れる
+            if cancelled.is_set():
+                return " ".join(texts), time.perf_counter() - t0, False
+            texts.append(s.text.strip())
+        return " ".join(texts), time.perf_counter() - t0, True
+
+    def _record_full_time(self, sec: float) -> None:
+        with self._lock:
+            est = self._full_estimate
+            self._full_estimate = sec if est is None else 0.8 * est + 0.2 * sec
+
+    # ----------------------------
+    # 認識本体
+    # ----------------------------
+    def recognize(self, path) -> TierResult:
+        t0 = time.perf_counter()
+        # 一度だけデコードして両モデルで共有（ファイルはこの後すぐ消してよい）
+        audio = decode_audio(path, sampling_rate=WHISPER_SAMPLE_RATE)
+        decode_sec = time.perf_counter() - t0
+
+        cancelled = threading.Event()
+        full_future = None
+        if self.speculative:
+            full_future = self._executor.submit(self._run_full, audio, cancelled)
+            full_future.add_done_callback(self._on_full_done)
+
+        t_fast = time.perf_counter()
+        fast_text, confidence = self._run_fast(audio)
+        fast_sec = time.perf_counter() - t_fast
+        intent = self.detect_intent(fast_text) if fast_text else None
+
+        if intent and confidence >= self.min_confidence:
+            # ✅ 小モデルで確定
+            cancelled.set()
+            if full_future is not None:
+                full_future.cancel()
+            total = time.perf_counter() - t0
+            with self._lock:
+                est = self._full_estimate
+            # フルモデルだけでもデコードは要るので、推定にデコード分を足して比べる
+            saved = decode_sec + est - total if est is not None else 0.0
+            result = TierResult(fast_text, "fast", intent, confidence, decode_sec, fast_sec,
+                                None, total, saved)
+        else:
+            # 🐢 フルモデルの結果を使う
+            if full_future is None:
+                full_future = self._executor.submit(self._run_full, audio, cancelled)
+                full_future.add_done_callback(self._on_full_done)
+            text, full_sec, _ = full_future.result()
+            total = time.perf_counter() - t0
+            result = TierResult(text, "full", intent, confidence, decode_sec, fast_sec, full_sec,
+                                total, decode_sec + full_sec - total)
+
+        self.turns.append(result)
+        return result
+
+    def _on_full_done(self, fut) -> None:
+        """打ち切られずに完走したフルモデルの所要時間だけを推定に使う"""
+        if fut.cancelled() or fut.exception() is not None:
+            return
+        _, sec, finished = fut.result()
+        if finished:
+            self._record_full_time(sec)
+
+    # ----------------------------
+    # 統計
+    # ----------------------------
+    def summary(self) -> dict:
+        turns = list(self.turns)
+        tiers = Counter(t.tier for t in turns)
+        return {
+            "turns": len(turns),
+            "fast": tiers["fast"],
+            "full": tiers["full"],
+            "saved_sec_total": sum(t.saved_sec for t in turns),
+            "mean_decode_sec": sum(t.decode_sec for t in turns) / len(turns) if turns else 0.0,
+            "mean_total_sec": sum(t.total_sec for t in turns) / len(turns) if turns else 0.0,
+            "full_estimate_sec": self._full_estimate,
+        }
+
+
+def _confidence(segments) -> float:
+    """
+    平均対数尤度を確率に戻した値（文字数で重み付け）。
+    無音らしさ（no_speech_prob）が高い区間があれば 0 扱い。
+    """
+    if not segments:
+        return 0.0
+    if any(s.no_speech_prob > 0.6 for s in segments):
+        return 0.0
+    weights = [max(len(s.text), 1) for s in segments]
+    avg = sum(s.avg_logprob * w for s, w in zip(segments, weights)) / sum(weights)
+    return math.exp(avg)
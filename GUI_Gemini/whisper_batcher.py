@@ -0,0 +1,221 @@
+"""
+whisper_batcher.py
+------------------
+1 つの WhisperModel を複数セッションで共有し、同時に来た文字起こし要求を
+まとめて 1 回のバッチ推論で処理するモジュール。
+
+・最初の要求が来てから最大 max_batch_wait 秒だけ後続を待ち、
+  max_batch_size 件まで 1 バッチにまとめる
+・smart_record の発話は 8 秒以下なので、30 秒窓 1 つに収まる音声は
+  エンコーダ／デコーダをバッチで 1 回だけ回す
+・30 秒を超える音声やバッチ推論が失敗したときは従来の transcribe() で 1 件ずつ
+・バッチ結果にも transcribe() と同じ判定をかける
+  無音らしい（no_speech_prob 高 かつ 対数尤度 低）→ 空文字
+  尤度が低い／同じ語の繰り返し（圧縮率 高）→ その件だけ transcribe() でやり直し
+
+    batcher = WhisperBatcher(whisper_model, max_batch_wait=0.05)
+    text = batcher.transcribe("voice.wav")          # 同期
+    fut  = batcher.submit(audio_ndarray)            # concurrent.futures.Future
+"""
+
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future, InvalidStateError
+from dataclasses import dataclass, field
+
+import numpy as np
+from faster_whisper.audio import decode_audio, pad_or_trim
+from faster_whisper.tokenizer import Tokenizer
+from faster_whisper.transcribe import get_compression_ratio, get_ctranslate2_storage
+
+WHISPER_SAMPLE_RATE = 16_000
+WINDOW_SEC = 30            # Whisper の 1 窓
+MAX_DECODE_TOKENS = 448
+
+# transcribe() の既定値と同じしきい値
+NO_SPEECH_THRESHOLD = 0.6
+LOG_PROB_THRESHOLD = -1.0
+COMPRESSION_RATIO_THRESHOLD = 2.4
+
+
+@dataclass
+class _Request:
+    audio: np.ndarray
+    future: Future
+    queued_at: float
+
+
+@dataclass
+class BatchStats:
+    """バッチ処理の統計（ロードジェネレータが表示する）"""
+    batches: int = 0
+    items: int = 0
+    fallbacks: int = 0                 # 1 件ずつ処理に落ちた件数
+    retries: int = 0                   # バッチ結果が怪しくてやり直した件数
+    no_speech: int = 0                 # 無音と判定して空文字にした件数
+    queue_wait_sec: float = 0.0        # 待ち時間の合計
+    sizes: Counter = field(default_factory=Counter)
+
+    def as_dict(self) -> dict:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "fallbacks": self.fallbacks,
+            "retries": self.retries,
+            "no_speech": self.no_speech,
+            "mean_batch_size": self.items / self.batches if self.batches else 0.0,
+            "mean_queue_wait_ms": self.queue_wait_sec / self.items * 1e3 if self.items else 0.0,
+            "sizes": dict(sorted(self.sizes.items())),
+        }
+
+
+class WhisperBatcher:
+    """
+    🎧 共有 WhisperModel のバッチ文字起こし
+    --------------------------------------
+    model          : faster_whisper.WhisperModel（全セッションで 1 つ）
+    max_batch_size : 1 バッチの最大件数
+    max_batch_wait : 最初の要求から後続を待つ最大秒（0 ならまとめない）
+    language       : バッチ推論は言語固定（自動判定は 1 件ずつになるため）
+    """
+
+    def __init__(self, model, max_batch_size: int = 8, max_batch_wait: float = 0.05,
+                 language: str = "ja", beam_size: int = 5):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_batch_wait = max_batch_wait
+        self.language = language
+        self.beam_size = beam_size
+        self.stats = BatchStats()
+        self._queue: queue.Queue = queue.Queue()
+        self._tokenizer = Tokenizer(
+            model.hf_tokenizer, model.model.is_multilingual,
+            task="transcribe", language=language,
+        )
+        self._prompt = model.get_prompt(self._tokenizer, [], without_timestamps=True)
+        self._worker = threading.Thread(target=self._loop, daemon=True, name="whisper-batcher")
+        self._worker.start()
+
+    # ----------------------------
+    # 受付
+    # ----------------------------
+    def submit(self, audio) -> Future:
+        """音声（WAV パス / バイト列の file-like / 16kHz float32 配列）を積んで Future を返す"""
+        if not isinstance(audio, np.ndarray):
+            audio = decode_audio(audio, sampling_rate=WHISPER_SAMPLE_RATE)
+        fut: Future = Future()
+        self._queue.put(_Request(audio, fut, time.monotonic()))
+        return fut
+
+    def transcribe(self, audio) -> str:
+        return self.submit(audio).result()
+
+    # ----------------------------
+    # バッチ処理スレッド
+    # ----------------------------
+    def _collect(self) -> list[_Request]:
+        """キャンセル済みの要求は捨てつつ 1 バッチ分を集める（空のこともある）"""
+        first = self._queue.get()
+        batch = [first] if first.future.set_running_or_notify_cancel() else []
+        deadline = time.monotonic() + self.max_batch_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    r = self._queue.get_nowait()             # もう来ている分だけ拾う
+                else:
+                    r = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if r.future.set_running_or_notify_cancel():
+                batch.append(r)
+        return batch
+
+    def _loop(self) -> None:
+        while True:
+            batch = self._collect()
+            if not batch:
+                continue
+            now = time.monotonic()
+            self.stats.batches += 1
+            self.stats.items += len(batch)
+            self.stats.sizes[len(batch)] += 1
+            self.stats.queue_wait_sec += sum(now - r.queued_at for r in batch)
+
+            window = WINDOW_SEC * WHISPER_SAMPLE_RATE
+            short = [r for r in batch if len(r.audio) <= window]
+            long_ = [r for r in batch if len(r.audio) > window]
+            retry = []
+            if len(short) > 1:
+                try:
+                    for r, text in zip(short, self._transcribe_batch([r.audio for r in short])):
+                        if text is None:
+                            retry.append(r)
+                        else:
+                            _resolve(r.future, result=text)
+                    short = []
+                except Exception as e:
+                    print("⚠️ バッチ文字起こし失敗 → 1 件ずつ処理:", e)
+            rest = short + long_
+            if len(batch) > 1:
+                self.stats.fallbacks += len(rest)
+            self.stats.retries += len(retry)
+            for r in rest + retry:
+                try:
+                    _resolve(r.future, result=self._transcribe_one(r.audio))
+                except Exception as e:
+                    _resolve(r.future, error=e)
+
+    def _transcribe_one(self, audio: np.ndarray) -> str:
+        segments, _ = self.model.transcribe(audio, language=self.language, beam_size=self.beam_size)
+        return " ".join(s.text.strip() for s in segments)
+
+    def _transcribe_batch(self, audios: list[np.ndarray]) -> list[str | None]:
+        """
+        30 秒以下の音声をまとめて 1 回のエンコード＋デコードで文字起こし。
+        transcribe() なら温度を上げてやり直す結果は None（呼び出し側で 1 件ずつ処理）。
+        """
+        fe = self.model.feature_extractor
+        feats = np.stack([
+            pad_or_trim(fe(a), fe.nb_max_frames) for a in audios
+        ]).astype(np.float32)
+        encoded = self.model.model.encode(get_ctranslate2_storage(feats))
+        results = self.model.model.generate(
+            encoded,
+            [self._prompt] * len(audios),
+            beam_size=self.beam_size,
+            max_length=MAX_DECODE_TOKENS,
+            suppress_blank=True,
+            suppress_tokens=[-1],
+            return_scores=True,
+            return_no_speech_prob=True,
+        )
+        return [self._check(r) for r in results]
+
+    def _check(self, result) -> str | None:
+        """1 件分の生成結果を transcribe() と同じ基準でふるいにかける"""
+        tokens = result.sequences_ids[0]
+        text = self._tokenizer.decode(tokens).strip()
+        # score は長さで割った累積対数尤度（length_penalty=1）→ transcribe() と同じ平均に直す
+        avg_logprob = result.scores[0] * len(tokens) / (len(tokens) + 1)
+        if result.no_speech_prob > NO_SPEECH_THRESHOLD and avg_logprob < LOG_PROB_THRESHOLD:
+            self.stats.no_speech += 1
+            return ""
+        if avg_logprob < LOG_PROB_THRESHOLD:
+            return None
+        if text and get_compression_ratio(text) > COMPRESSION_RATIO_THRESHOLD:
+            return None
+        return text
+
+
+def _resolve(fut: Future, result=None, error: BaseException | None = None) -> None:
+    """結果を渡す（相手の都合で渡せなくても処理スレッドは止めない）"""
+    try:
+        if error is None:
+            fut.set_result(result)
+        else:
+            fut.set_exception(error)
+    except InvalidStateError:
+        pass
@@ -1,18 +1,61 @@
 // Chrome拡張機能のバックグラウンドスクリプト
-chrome.tabs.onActivated.addListener(async (activeInfo) => {
-    try {
-        const tab = await chrome.tabs.get(activeInfo.tabId);
-        console.log("Current Tab Info:", tab); // タブ情報をログに出力
-        console.log("Sending URL:", tab.url);
+// タブ切り替え／読み込み完了でページ本文を抽出して Python 側へ送る
+const ENDPOINT = "http://127.0.0.1:5000/browser-data";
+const DEBOUNCE_MS = 300;        // 連続切り替えは最後の 1 回だけ送る
+const MAX_TEXT_CHARS = 20000;   // サーバー側の保存上限と揃える
+
+let timer = null;
 
-        await fetch("http://127.0.0.1:5000/browser-data", { // URLを確認
-            method: "POST",
-            headers: {
-                "Content-Type": "application/json"
-            },
-            body: JSON.stringify({ url: tab.url, title: tab.title })
+function scheduleSend(tabId) {
+    clearTimeout(timer);
+    timer = setTimeout(() => sendTab(tabId), DEBOUNCE_MS);
+}
+
+// ページ本文を抽出（chrome:// など注入できないページは空文字）
+async function extractText(tabId) {
+    try {
+        const [result] = await chrome.scripting.executeScript({
+            target: { tabId },
+            func: (limit) => (document.body ? document.body.innerText : "").slice(0, limit),
+            args: [MAX_TEXT_CHARS]
         });
+        return result?.result || "";
+    } catch (error) {
+        return "";
+    }
+}
+
+// JSON を gzip 圧縮（CompressionStream 非対応なら無圧縮）
+async function encodeBody(payload) {
+    const json = JSON.stringify(payload);
+    if (typeof CompressionStream === "undefined") {
+        return { body: json, headers: { "Content-Type": "application/json" } };
+    }
+    const stream = new Blob([json]).stream().pipeThrough(new CompressionStream("gzip"));
+    const body = await new Response(stream).arrayBuffer();
+    return {
+        body,
+        headers: { "Content-Type": "application/json", "Content-Encoding": "gzip" }
+    };
+}
+
+async function sendTab(tabId) {
+    try {
+        const tab = await chrome.tabs.get(tabId);
+        if (!tab.url) return;
+        const text = await extractText(tabId);
+        const { body, headers } = await encodeBody({ url: tab.url, title: tab.title, text });
+        await fetch(ENDPOINT, { method: "POST", headers, body });
     } catch (error) {
         console.error("Error fetching tab or sending data:", error);
     }
+}
+
+chrome.tabs.onActivated.addListener((activeInfo) => scheduleSend(activeInfo.tabId));
+
+// 同じタブ内での遷移（読み込み完了時）も拾う
+chrome.tabs.onUpdated.addListener((tabId, changeInfo, tab) => {
+    if (changeInfo.status === "complete" && tab.active) {
+        scheduleSend(tabId);
+    }
 });
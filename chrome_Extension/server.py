@@ -1,14 +1,15 @@
-from flask import Flask, request
-from flask_cors import CORS
+"""
+拡張だけを試すための単体受信サーバー。
+ルートの実装は GUI_Gemini/browser_ingest.py と共通。
+"""
+import sys
+from pathlib import Path
 
-app = Flask(__name__)
-CORS(app)
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "GUI_Gemini"))
 
-@app.route('/browser-data', methods=['POST'])
-def browser_data():
-    data = request.json
-    print("Received browser data:", data)
-    return "OK", 200
+from browser_ingest import create_app
+
+app = create_app(verbose=True)
 
 if __name__ == "__main__":
-    app.run(port=5000)
\ No newline at end of file
+    app.run(port=5000)